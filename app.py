@@ -21,12 +21,33 @@
 #   ✅ Чекбокс "Использовать серую палитру" (0.6 / 0.4 / 0.6)
 # ================================================================
 
-from flask import Flask, render_template_string, request, send_file
-import io
+from flask import (Flask, Response, render_template_string, request, send_file,
+                   make_response, jsonify, stream_with_context, g)
 import os
-from font_on_temp5_to_gost import TextRenderer, render_training_letter_images
-import getpass
-from datetime import datetime
+import sys
+import tempfile
+import time
+
+# Сервер без дисплея: matplotlib сразу берёт Agg, не перебирая интерактивные бэкенды
+os.environ.setdefault("MPLBACKEND", "Agg")
+
+from render_service import (FORMATS, DOCUMENT_NAME, TRAINING_GIF, TRAINING_MIMETYPE, BUNDLE_NAME,
+                            ensure_output, output_name, store_params, output_stats,
+                            document_name, bundle_files, prewarm, request_training,
+                            validate_params)
+from zip_stream import stream_zip
+from glyph_atlas import preload_atlases
+from result_store import ResultStore, DEFAULT_MAX_ENTRIES
+from render_jobs import JobQueue, QueueFullError, parse_job_id
+from parallel_render import PAGE_FORMATS
+from batch import stream_batch
+from preview import PREVIEW_DPI, preview_png, preview_stats
+from font_on_temp5_to_gost import cache_stats as layout_cache_stats
+from pdf_renderer import PDF_OPS_CACHE
+from raster_renderer import POLYGON_CACHE
+from svg_renderer import SVG_PATH_CACHE
+from batch import RENDERER_CACHE
+import metrics
 
 # ------------------------------------------------
 #  ИНИЦИАЛИЗАЦИЯ ПРИЛОЖЕНИЯ
@@ -54,12 +75,62 @@ FONT_LABELS = {
     "gost_type_b_italic.ttf": "ГОСТ тип B (наклонный)"
 }
 
+# Хранилище результатов: общий каталог для всех воркеров gunicorn
+RESULTS_DIR = os.environ.get("RESULTS_DIR",
+                             os.path.join(tempfile.gettempdir(), "lettertrainer_results"))
+RESULTS_MAX_BYTES = int(os.environ.get("RESULTS_MAX_MB", "512")) * 1024 * 1024
+RESULTS_MAX_ENTRIES = int(os.environ.get("RESULTS_MAX_ENTRIES", str(DEFAULT_MAX_ENTRIES))) or None   # 0 — без лимита числа
+RENDER_COOKIE = "render_id"
+
+# Пул фоновых заданий рендера: процессов всего по числу ядер, лимит глубины очереди —
+# тоже на все воркеры gunicorn (WEB_CONCURRENCY). Каждый воркер получает свою долю,
+# иначе процессов рендера было бы воркеры × ядра
+WEB_WORKERS = max(int(os.environ.get("WEB_CONCURRENCY", "1")), 1)
+RENDER_WORKERS = int(os.environ.get("RENDER_WORKERS", "0")) or os.cpu_count() or 1
+RENDER_QUEUE_LIMIT = int(os.environ.get("RENDER_QUEUE_LIMIT", "0")) or RENDER_WORKERS * 4
+# Ожидание задания внутри запроса (?wait=N): намного меньше таймаута воркера gunicorn
+# (timeout в gunicorn.conf.py), дальше клиент опрашивает по 202 + Location/Retry-After
+JOB_WAIT_LIMIT = 5.0
+
+# Кэширование gif-анимации: по ?id=... содержимое неизменно (render_id — хэш параметров)
+GIF_CACHE_IMMUTABLE = "public, max-age=31536000, immutable"
+GIF_CACHE_COOKIE = "private, no-cache"
+GIF_RETRY_AFTER = "2"
+DOCUMENT_RETRY_AFTER = "5"
+
+# Пакетная генерация: максимум строк манифеста в одном запросе
+BATCH_MAX_ENTRIES = int(os.environ.get("BATCH_MAX_ENTRIES", "5000"))
+
+# Прогрев шрифтов и кодеков при старте: с preload_app в gunicorn — один раз в мастере,
+# воркеры получают готовые кэши при fork (copy-on-write)
+PREWARM_FONTS = os.environ.get("PREWARM_FONTS", "1") == "1"
+
+# Заголовок Server-Timing с этапами рендера: всегда (SERVER_TIMING=1) или по ?timing=1
+SERVER_TIMING = os.environ.get("SERVER_TIMING", "0") == "1"
+
 # Собираем список шрифтов в папке fonts/
 AVAILABLE_FONTS = sorted([
     f for f in os.listdir(FONTS_DIR)
     if f.lower().endswith((".ttf", ".otf"))
 ]) if os.path.isdir(FONTS_DIR) else []
 
+# Имена файлов шрифтов сверяются без учёта регистра (в fonts/ они как GOST_type_A_Italic.ttf)
+FONTS_BY_NAME = {f.lower(): f for f in AVAILABLE_FONTS}
+DEFAULT_FONT_FILE = FONTS_BY_NAME.get("gost_type_a_italic.ttf",
+                                      AVAILABLE_FONTS[0] if AVAILABLE_FONTS else "")
+
+# Атласы глифов: собираются один раз и отображаются в память каждым воркером
+FONT_PATHS = [os.path.join(FONTS_DIR, f) for f in AVAILABLE_FONTS]
+preload_atlases(FONT_PATHS)
+if PREWARM_FONTS:
+    prewarm(FONT_PATHS)
+    metrics.reset()   # замеры прогрева не должны попасть в метрики воркеров
+
+result_store = ResultStore(RESULTS_DIR, RESULTS_MAX_BYTES, RESULTS_MAX_ENTRIES)
+job_queue = JobQueue(result_store,
+                     workers=max(RENDER_WORKERS // WEB_WORKERS, 1),
+                     max_pending=max(RENDER_QUEUE_LIMIT // WEB_WORKERS, 1))
+
 # ------------------------------------------------
 #  HTML-ФОРМА
 # ------------------------------------------------
@@ -189,20 +260,25 @@ Proprietary software 2025.</textarea>
     <input type="checkbox" name="training_real">
     Режим обучения (символы кириллицы из текста, см. gif)
 
+    <p><b>Предпросмотр листа:</b><br>
+      <img id="preview" alt="" style="width: 300px; border: 1px solid #ccc; background: #fff;">
+    </p>
+
     <input type="submit" value="Сгенерировать gif(V), PDF, PNG и SVG">
 
     {% if generated %}
       <p style="margin-top: 20px;">
-        <label for="output_dir">Папка для сохранения:</label>
-        <input type="text" name="output_dir"
-               placeholder="например, output_2025-10-07_14-33-11_admin"
-               style="width: 100%; padding: 5px;" />
 
       <div style="line-height: 0.4em;">
 
-      <p><a href="/download/pdf">📄 Скачать PDF</a></p>
-      <p><a href="/download/png">🖼️ Скачать PNG</a></p>
-      <p><a href="/download/svg">🧬 Скачать SVG</a></p>
+      <p><a href="/download/pdf?id={{ render_id }}">📄 Скачать PDF</a></p>
+      <p><a href="/download/png?id={{ render_id }}">🖼️ Скачать PNG</a></p>
+      <p><a href="/download/svg?id={{ render_id }}">🧬 Скачать SVG</a></p>
+      <p><a href="/download/document?id={{ render_id }}&wait=5">📚 Скачать PDF (все страницы)</a></p>
+      <p><a href="/download/bundle?id={{ render_id }}">🗂️ Скачать всё одним архивом (ZIP)</a></p>
+      {% if training %}
+      <p><a href="/download/gif?id={{ render_id }}&wait=5">🎞️ Скачать gif-анимацию обучения</a></p>
+      {% endif %}
     {% endif %}
   </form>
 
@@ -235,198 +311,512 @@ Proprietary software 2025.</textarea>
         document.getElementById("font_color").value = grayMode ? "0.6" : "lightgray";
     });
 
+    // Предпросмотр: запрос уходит через 250 мс после последней правки,
+    // устаревший запрос отменяется
+    let previewTimer = null;
+    let previewAbort = null;
+
+    function updatePreview() {
+        if (previewAbort) previewAbort.abort();
+        previewAbort = new AbortController();
+        fetch("/preview", {method: "POST", body: new FormData(document.querySelector("form")),
+                           signal: previewAbort.signal})
+            .then(r => r.ok ? r.blob() : null)
+            .then(blob => {
+                if (!blob) return;
+                const img = document.getElementById("preview");
+                const old = img.src;
+                img.src = URL.createObjectURL(blob);
+                if (old.startsWith("blob:")) URL.revokeObjectURL(old);
+            })
+            .catch(() => {});
+    }
+
+    function schedulePreview() {
+        clearTimeout(previewTimer);
+        previewTimer = setTimeout(updatePreview, 250);
+    }
+
     document.addEventListener("DOMContentLoaded", updateLineWidth);
+    document.addEventListener("DOMContentLoaded", updatePreview);
     document.getElementById("font_size").addEventListener("input", updateLineWidth);
     document.getElementById("auto_line_width").addEventListener("change", updateLineWidth);
+    document.querySelector("form").addEventListener("input", schedulePreview);
+    document.querySelector("form").addEventListener("change", schedulePreview);
   </script>
 </body>
 </html>
 """
 
+# ------------------------------------------------
+#  РАЗБОР ФОРМЫ
+# ------------------------------------------------
+def _read_render_params():
+    """
+    Читает текст и параметры рендера из формы (общая часть для / и /jobs).
+    ValueError — некорректный цвет или шаг сетки.
+    """
+    # --- 1. Текст: приоритет — файл .txt ---
+    lines = []
+    if "textfile" in request.files:
+        file = request.files["textfile"]
+        if file and file.filename.lower().endswith(".txt"):
+            try:
+                content = file.read().decode("utf-8")
+            except UnicodeDecodeError:
+                content = file.read().decode("cp1251", errors="ignore")
+            lines = [ln.strip() for ln in content.splitlines() if ln.strip()]
+    # Если файла нет — берём текст из textarea       
+    if not lines:
+        text = request.form.get("text", "")
+        lines = [ln.strip() for ln in text.splitlines() if ln.strip()]
+
+    # --- 2. Чтение числовых параметров ---
+    def _f(name, default):
+        try:
+            return float(request.form.get(name, default))
+        except (TypeError, ValueError):
+            return default
+
+    spacing   = _f("spacing", 4.2)
+    font_size = _f("font_size", 10.0)
+    thin_step_h = _f("thin_step_h", round(font_size / 14.0, 1))
+    thin_step_v = _f("thin_step_v", round(font_size / 14.0, 1))
+
+    # --- Толщина линий (новая логика) ---
+    auto_line_width = "auto_line_width" in request.form
+    if auto_line_width:
+        line_width = round(font_size / 14.0, 1)
+    else:
+        line_width = _f("line_width", round(font_size / 14.0, 1))
+
+    # --- 3. Цвета и флаги ---
+    frame_color = request.form.get("frame_color", "#B3E5FC")
+    grid_color  = request.form.get("grid_color",  "#81D4FA")
+    font_color  = request.form.get("font_color",  "lightgray")
+
+    show_grid    = "show_grid" in request.form
+    show_font    = "show_font" in request.form
+    dots_only    = "dots_only" in request.form
+    classic_grid = "classic_grid" in request.form
+
+    # --- Выбор шрифта ---
+    font_file = os.path.basename(request.form.get("font_file", ""))
+    font_file = FONTS_BY_NAME.get(font_file.lower(), DEFAULT_FONT_FILE)
+    font_path = os.path.join(FONTS_DIR, font_file)
+
+    return validate_params(dict(
+        lines=lines,
+        font_path=font_path,
+        spacing=spacing,
+        font_size=font_size,
+        line_width=line_width,
+        frame_color=frame_color,
+        grid_color=grid_color,
+        font_color=font_color,
+        show_grid=show_grid,
+        show_font=show_font,
+        dots_only=dots_only,
+        classic_grid=classic_grid,
+        thin_step_h=thin_step_h,
+        thin_step_v=thin_step_v
+    ))
+
 # ------------------------------------------------
 #  ОСНОВНОЙ МАРШРУТ
 # ------------------------------------------------
 @app.route("/", methods=["GET", "POST"])
 def index():
     """
-    Основной маршрут: обрабатывает форму, создаёт PDF и PNG.
+    Основной маршрут: обрабатывает форму и сохраняет параметры рендера
+    в хранилище. render_id — хэш нормализованных параметров, поэтому одинаковые
+    запросы делят готовые файлы. PDF, PNG и SVG строятся при первом скачивании,
+    gif-анимация обучения — фоновым заданием, не задерживая ответ.
     """
-    global generated_pdf, generated_png, generated_svg
     generated = False
+    training = False
+    render_id = None
 
     if request.method == "POST":
-        # --- 1. Текст: приоритет — файл .txt ---
-        lines = []
-        if "textfile" in request.files:
-            file = request.files["textfile"]
-            if file and file.filename.lower().endswith(".txt"):
-                try:
-                    content = file.read().decode("utf-8")
-                except UnicodeDecodeError:
-                    content = file.read().decode("cp1251", errors="ignore")
-                lines = [ln.strip() for ln in content.splitlines() if ln.strip()]
-        # Если файла нет — берём текст из textarea       
-        if not lines:
-            text = request.form.get("text", "")
-            lines = [ln.strip() for ln in text.splitlines() if ln.strip()]
-
-        # --- 2. Чтение числовых параметров ---
-        def _f(name, default):
-            try:
-                return float(request.form.get(name, default))
-            except (TypeError, ValueError):
-                return default
-
-        spacing   = _f("spacing", 4.2)
-        font_size = _f("font_size", 10.0)
-        thin_step_h = _f("thin_step_h", round(font_size / 14.0, 1))
-        thin_step_v = _f("thin_step_v", round(font_size / 14.0, 1))
-
-        # --- Толщина линий (новая логика) ---
-        auto_line_width = "auto_line_width" in request.form
-        if auto_line_width:
-            line_width = round(font_size / 14.0, 1)
-        else:
-            line_width = _f("line_width", round(font_size / 14.0, 1))
-
-        # --- 3. Цвета и флаги ---
-        frame_color = request.form.get("frame_color", "#B3E5FC")
-        grid_color  = request.form.get("grid_color",  "#81D4FA")
-        font_color  = request.form.get("font_color",  "lightgray")
-
-        show_grid    = "show_grid" in request.form
-        show_font    = "show_font" in request.form
-        dots_only    = "dots_only" in request.form
-        classic_grid = "classic_grid" in request.form
-
-        # --- Выбор шрифта ---
-        font_file = request.form.get("font_file", "gost_type_a_italic.ttf")
-        if not font_file or font_file not in AVAILABLE_FONTS:
-            font_file = "gost_type_a_italic.ttf"
-        font_path = os.path.join(FONTS_DIR, font_file)
-        
-        # --- Режим обучения (реальные символы) — создаёт training_real.gif ---
-        if "training_real" in request.form:
-            try:
-                from font_on_temp5_to_gost import render_training_letter_images
-                output_dir = request.form.get("output_dir")
-                if not output_dir or output_dir.strip() == "":
-                    from datetime import datetime
-                    import getpass
-                    username = getpass.getuser()
-                    date_str = datetime.now().strftime("%Y-%m-%d")
-                    output_dir = f"output_{date_str}_{username}" # Выбор папки для GIF анимации
-
-                os.makedirs(output_dir, exist_ok=True)
-
-                gif_path = os.path.join(output_dir, "training_images.gif")
-                render_training_letter_images(lines, save_path=gif_path)
-
-                print(f"✅ training_images.gif сохранён в: {gif_path}")
-
-                print("✅ training_images.gif сохранён (по PNG)")
-                
-            except Exception as e:
-                print("⚠️ Ошибка при создании training_real.gif:", e)
-
-
-                # --- Рендер ---
-        renderer = TextRenderer(
-            font_path=font_path,
-            spacing=spacing,
-            font_size=font_size,
-            frame_color=frame_color,
-            grid_color=grid_color,
-            font_color=font_color,
-            line_width=line_width
-        )
-
-        fig = renderer.render_to_figure(
-            lines,
-            show_grid=show_grid,
-            show_font=show_font,
-            dots_only=dots_only,
-            classic_grid=classic_grid,
-            thin_step_h=thin_step_h,
-            thin_step_v=thin_step_v
-        )
-
-        # Генерация SVG
-        svg_buffer = io.BytesIO()
-        fig.savefig(svg_buffer, format="svg", bbox_inches="tight")
-        svg_buffer.seek(0)
-        generated_svg = svg_buffer
-
-
-        # --- Сохранение PDF и PNG в память ---
-        buf_pdf, buf_png = io.BytesIO(), io.BytesIO()
-        fig.savefig(buf_pdf, format="pdf", bbox_inches="tight")
-        fig.savefig(buf_png, format="png", dpi=300, bbox_inches="tight")
-        buf_pdf.seek(0), buf_png.seek(0)
-
-        # Сохраняем буферы в глобальные переменные (для скачивания)
-        global generated_pdf, generated_png
-        generated_pdf, generated_png = buf_pdf, buf_png
+        try:
+            with metrics.stage("parse"):
+                params = _read_render_params()
+        except ValueError as e:
+            return str(e), 400
+
+        # --- Рендер: только параметры, форматы строятся по запросу ---
+        with metrics.stage("store"):
+            render_id = store_params(result_store, params)
         generated = True
 
-    return render_template_string(HTML_FORM,
-                                  generated=generated,
-                                  fonts=AVAILABLE_FONTS,
-                                  labels=FONT_LABELS)
+        # --- Режим обучения (реальные символы) — gif-анимация в фоне, в хранилище ---
+        if "training_real" in request.form:
+            training = True
+            request_training(result_store, render_id)
+            if result_store.path(render_id, TRAINING_GIF) is None:
+                try:
+                    job_queue.submit("training", render_id)
+                except QueueFullError as e:
+                    # Не страшно: /download/gif поставит задание повторно
+                    print("⚠️ Анимация обучения не поставлена в очередь:", e)
+
+
+    response = make_response(render_template_string(HTML_FORM,
+                                                    generated=generated,
+                                                    training=training,
+                                                    render_id=render_id,
+                                                    fonts=AVAILABLE_FONTS,
+                                                    labels=FONT_LABELS))
+    if render_id:
+        response.set_cookie(RENDER_COOKIE, render_id, httponly=True, samesite="Lax")
+    return response
 
 # ------------------------------------------------
-#  СКАЧИВАНИЕ PDF / PNG
+#  СКАЧИВАНИЕ PDF / PNG / SVG
 # ------------------------------------------------
+# Рендер ищется по ?id=..., иначе по cookie последнего рендера этого пользователя
+def _send_format(fmt):
+    """
+    Файл формата из хранилища (строится при первом обращении) или None.
+    """
+    render_id = request.args.get("id") or request.cookies.get(RENDER_COOKIE)
+    if not result_store.valid_id(render_id):
+        return None
+    path = ensure_output(result_store, render_id, fmt)
+    if path is None:
+        return None
+    mimetype, download_name = FORMATS[fmt]
+    return send_file(path,
+                     as_attachment=True,
+                     download_name=download_name,
+                     mimetype=mimetype)
+
 @app.route("/download/pdf")
 def download_pdf():
     """
-    Возвращает PDF. Создаёт новый поток из сохранённого содержимого,
-    чтобы избежать ошибки "I/O operation on closed file" при повторном скачивании.
+    Возвращает PDF. При первом скачивании строит его по сохранённым параметрам.
     """
-    global generated_pdf
-    if generated_pdf:
-        try:
-            # Считываем данные из потока (даже если он закрыт)
-            data = generated_pdf.getvalue()
-        except ValueError:
-            # Если поток уже закрыт Flask'ом — просто игнорируем
-            data = b""
-        # Создаём новый BytesIO для отправки клиенту
-        buffer_copy = io.BytesIO(data)
-        buffer_copy.seek(0)
-        return send_file(buffer_copy,
-                         as_attachment=True,
-                         download_name="gost_titul.pdf",
-                         mimetype="application/pdf")
-    return "PDF не создан"
+    return _send_format("pdf") or "PDF не создан"
 
 
 @app.route("/download/png")
 def download_png():
     """
-    Возвращает PNG. Создаёт новый поток из сохранённого содержимого,
-    чтобы избежать ошибки "I/O operation on closed file" при повторном скачивании.
+    Возвращает PNG. При первом скачивании строит его по сохранённым параметрам.
     """
-    global generated_png
-    if generated_png:
-        try:
-            data = generated_png.getvalue()
-        except ValueError:
-            data = b""
-        buffer_copy = io.BytesIO(data)
-        buffer_copy.seek(0)
-        return send_file(buffer_copy,
-                         as_attachment=True,
-                         download_name="gost_titul.png",
-                         mimetype="image/png")
-    return "PNG не создан"
+    return _send_format("png") or "PNG не создан"
 
 @app.route("/download/svg")
 def download_svg():
-    global generated_svg
-    if not generated_svg:
-        return "SVG не сгенерирован", 404
-    return send_file(generated_svg, mimetype="image/svg+xml", as_attachment=True, download_name="gost_output.svg")    
+    return _send_format("svg") or ("SVG не сгенерирован", 404)
+
+@app.route("/download/bundle")
+def download_bundle():
+    """
+    Все форматы рендера (и gif-анимация, если она есть) одним ZIP-архивом.
+    Архив пишется в ответ по частям, файлы читаются с диска кусками.
+    """
+    render_id = request.args.get("id") or request.cookies.get(RENDER_COOKIE)
+    if result_store.get_params(render_id) is None:
+        return "Архив не создан", 404
+    return Response(stream_with_context(stream_zip(bundle_files(result_store, render_id))),
+                    mimetype="application/zip",
+                    headers={"Content-Disposition": f"attachment; filename={BUNDLE_NAME}"})
+
+def _job_file(kind, render_id, name, formats=(), retry_after=GIF_RETRY_AFTER):
+    """
+    Файл фонового задания из хранилища: (путь, None), если он готов, иначе
+    (None, ответ) — 202 со ссылкой на статус, 500 или 503. Нет ни файла, ни
+    задания (или файл вытеснен) — задание ставится заново; ?wait=N — подождать
+    готовности до N секунд. (None, None) — задание выполнено, но файла не дало.
+    """
+    path = result_store.path(render_id, name)
+    if path is not None:
+        return path, None
+    job_id = job_queue.find(kind, render_id, formats)
+    info = job_queue.status(job_id) if job_id else None
+    if info and info["status"] == "done" and not info["outputs"]:
+        return None, None
+    if info and info["status"] == "failed":
+        return None, (jsonify(info), 500)
+    if info is None or info["status"] == "done":
+        # Задания не было или файл успели вытеснить из хранилища
+        try:
+            job_id = job_queue.submit(kind, render_id, formats)
+        except QueueFullError as e:
+            response = jsonify(error=str(e))
+            response.status_code = 503
+            response.headers["Retry-After"] = "5"
+            return None, response
+    wait = min(request.args.get("wait", 0, type=float), JOB_WAIT_LIMIT)
+    if wait > 0:
+        job_queue.wait(job_id, wait)
+    path = result_store.path(render_id, name)
+    if path is None:
+        response = _job_response(job_queue.status(job_id))
+        response.status_code = 202
+        response.headers["Location"] = f"/jobs/{job_id}"
+        response.headers["Retry-After"] = retry_after
+        return None, response
+    return path, None
+
+@app.route("/download/gif")
+def download_gif():
+    """
+    Gif-анимация обучения из хранилища. Если её ещё нет — ставит фоновое
+    задание и отвечает 202 со ссылкой на статус; ?wait=N — подождать
+    готовности до N секунд. Файл отдаётся потоком, с ETag и Cache-Control.
+    """
+    render_id = request.args.get("id") or request.cookies.get(RENDER_COOKIE)
+    if result_store.get_params(render_id) is None:
+        return "Анимация не создана", 404
+
+    path, response = _job_file("training", render_id, TRAINING_GIF)
+    if response is not None:
+        return response
+    if path is None:
+        return "В тексте нет букв с изображениями для анимации", 404
+
+    # conditional=True: If-None-Match -> 304, Range -> 206
+    response = send_file(path, as_attachment=True, download_name=TRAINING_GIF,
+                         mimetype=TRAINING_MIMETYPE, etag=render_id, conditional=True)
+    response.headers["Cache-Control"] = (GIF_CACHE_IMMUTABLE if request.args.get("id")
+                                         else GIF_CACHE_COOKIE)
+    return response
+
+@app.route("/download/document", methods=["GET", "POST"])
+def download_document():
+    """
+    Многостраничный PDF для длинного текста: строки переносятся по листам А4.
+    POST — поля формы как у "/", GET — сохранённый рендер (?id=... или cookie).
+    pages=png — растровые страницы.
+    Документ строит задание в пуле JobQueue и пишет в хранилище по страницам:
+    сотни страниц рендерятся дольше таймаута воркера gunicorn, а пул ограничен
+    RENDER_WORKERS. Пока файла нет — 202 со ссылкой на статус, как у /download/gif.
+    """
+    pages = request.values.get("pages", "pdf")
+    if pages not in PAGE_FORMATS:
+        return "Неизвестный формат страниц", 400
+    if request.method == "POST":
+        try:
+            params = _read_render_params()
+        except ValueError as e:
+            return str(e), 400
+        render_id = store_params(result_store, params)
+    else:
+        render_id = request.args.get("id") or request.cookies.get(RENDER_COOKIE)
+        if result_store.get_params(render_id) is None:
+            return "PDF не создан", 404
+
+    path, response = _job_file("document", render_id, document_name(pages), [pages],
+                               DOCUMENT_RETRY_AFTER)
+    if response is not None:
+        return response
+    return send_file(path, as_attachment=True, download_name=DOCUMENT_NAME,
+                     mimetype="application/pdf", etag=f"{render_id}-{pages}", conditional=True)
+
+
+# ------------------------------------------------
+#  ПРЕДПРОСМОТР
+# ------------------------------------------------
+@app.route("/preview", methods=["POST"])
+def preview():
+    """
+    PNG листа в низком разрешении (?dpi=..., по умолчанию PREVIEW_DPI) по полям формы.
+    Ничего не сохраняет: раскладка и слои сетки и букв берутся из кэша воркера,
+    поэтому правка шага сетки перерисовывает только сетку, а цвета — ничего.
+    """
+    try:
+        params = _read_render_params()
+        with metrics.stage("preview"):
+            png = preview_png(params, request.values.get("dpi", PREVIEW_DPI, type=int))
+    except ValueError as e:
+        # Например, цвет, который ещё не допечатан в поле, или нулевой шаг сетки
+        return jsonify(error=str(e)), 400
+    response = make_response(png)
+    response.mimetype = "image/png"
+    response.headers["Cache-Control"] = "no-store"
+    return response
+
+# ------------------------------------------------
+#  ПАКЕТНАЯ ГЕНЕРАЦИЯ
+# ------------------------------------------------
+@app.route("/batch", methods=["POST"])
+def batch():
+    """
+    Пакет листов по манифесту JSON Lines (файл "manifest" или тело запроса).
+    Отдаёт ZIP-архив потоком: листы пишутся в ответ по мере рендера.
+    """
+    if "manifest" in request.files:
+        raw = request.files["manifest"].read()
+    else:
+        raw = request.get_data()
+    try:
+        manifest = raw.decode("utf-8-sig").splitlines()
+    except UnicodeDecodeError:
+        return jsonify(error="Манифест должен быть в UTF-8"), 400
+    entries = sum(1 for ln in manifest if ln.strip() and not ln.lstrip().startswith("#"))
+    if not entries:
+        return jsonify(error="Манифест пуст"), 400
+    if entries > BATCH_MAX_ENTRIES:
+        return jsonify(error=f"Не больше {BATCH_MAX_ENTRIES} листов за запрос"), 413
+    return Response(stream_with_context(stream_batch(manifest)),
+                    mimetype="application/zip",
+                    headers={"Content-Disposition": "attachment; filename=gost_batch.zip"})
+
+# ------------------------------------------------
+#  ФОНОВЫЕ ЗАДАНИЯ РЕНДЕРА
+# ------------------------------------------------
+def _job_response(info):
+    info = dict(info)
+    if info.get("status") == "done":
+        # Ссылки по render_id: файл отдаёт любой воркер из общего хранилища
+        info["downloads"] = {fmt: f"/download/{fmt}?id={info['render_id']}"
+                             for fmt in info.get("outputs", []) if fmt in FORMATS}
+        if TRAINING_GIF in info.get("outputs", []):
+            info["downloads"]["gif"] = f"/download/gif?id={info['render_id']}"
+        if info.get("kind") == "document":
+            info["downloads"]["document"] = (f"/download/document?id={info['render_id']}"
+                                             f"&pages={info['formats'][0]}")
+    return jsonify(info)
+
+@app.route("/jobs", methods=["POST"])
+def submit_job():
+    """
+    Ставит рендер в очередь пула процессов. Поля формы те же, что у "/";
+    formats — список через запятую (по умолчанию pdf,png,svg),
+    kind=training — задание на gif-анимацию обучения.
+    """
+    kind = request.form.get("kind", "render")
+    formats = [f for f in request.form.get("formats", ",".join(FORMATS)).split(",") if f]
+    if kind not in ("render", "training") or not formats or any(f not in FORMATS for f in formats):
+        return jsonify(error="Неизвестный тип задания или формат"), 400
+    # Хранилище пополняется только принятыми заданиями
+    try:
+        params = _read_render_params()
+    except ValueError as e:
+        return jsonify(error=str(e)), 400
+    render_id = store_params(result_store, params)
+    if kind == "training":
+        request_training(result_store, render_id)
+    try:
+        job_id = job_queue.submit(kind, render_id, formats)
+    except QueueFullError as e:
+        response = jsonify(error=str(e))
+        response.status_code = 503
+        response.headers["Retry-After"] = "5"
+        return response
+    response = _job_response(job_queue.status(job_id))
+    response.status_code = 202
+    response.headers["Location"] = f"/jobs/{job_id}"
+    return response
+
+@app.route("/jobs/<job_id>")
+def job_status(job_id):
+    """
+    Статус задания; ?wait=N — подождать завершения до N секунд.
+    """
+    wait = min(request.args.get("wait", 0, type=float), JOB_WAIT_LIMIT)
+    info = job_queue.wait(job_id, wait) if wait > 0 else job_queue.status(job_id)
+    if info is None:
+        return jsonify(error="Задание не найдено"), 404
+    return _job_response(info)
+
+@app.route("/jobs/<job_id>/result/<fmt>")
+def job_result(job_id, fmt):
+    render_id, _ = parse_job_id(job_id)
+    if render_id is None or fmt not in FORMATS:
+        return jsonify(error="Задание или формат не найдены"), 404
+    path = result_store.path(render_id, output_name(fmt))
+    if path is None:
+        info = job_queue.status(job_id)
+        if info is None:
+            return jsonify(error="Задание не найдено"), 404
+        if info["status"] != "done":
+            return _job_response(info), 409
+        if fmt not in info.get("outputs", []):
+            return jsonify(error="Формат не заказан в этом задании"), 404
+        return jsonify(error="Результат вытеснен из хранилища"), 410
+    mimetype, download_name = FORMATS[fmt]
+    return send_file(path, as_attachment=True, download_name=download_name, mimetype=mimetype)
+
+@app.route("/jobs/metrics")
+def jobs_metrics():
+    """
+    Глубина очереди и счётчики пула заданий этого воркера.
+    """
+    return jsonify(job_queue.metrics())
+
+@app.route("/cache/stats")
+def cache_stats():
+    """
+    Попадания и промахи кэша готовых форматов (в этом воркере) и заполненность хранилища.
+    """
+    return jsonify(outputs=output_stats(), store=result_store.stats(), preview=preview_stats())
+
+# ------------------------------------------------
+#  МЕТРИКИ
+# ------------------------------------------------
+@app.before_request
+def _start_timing():
+    g.request_started = time.perf_counter()
+    metrics.begin_request()
+
+@app.after_request
+def _finish_timing(response):
+    """
+    Длительность и счётчик запросов по маршрутам; этапы рендера —
+    в заголовок Server-Timing, если он включён.
+    """
+    timings = metrics.end_request()
+    started = g.pop("request_started", None)
+    if started is None:
+        return response
+    total = time.perf_counter() - started
+    endpoint = request.endpoint or "unknown"
+    metrics.observe("request_seconds", total, endpoint=endpoint)
+    metrics.inc("requests_total", endpoint=endpoint, status=response.status_code)
+    if SERVER_TIMING or request.args.get("timing") == "1":
+        response.headers["Server-Timing"] = metrics.server_timing(timings, total)
+    return response
+
+def _extra_metrics():
+    caches = {f"layout_{name}": stats for name, stats in layout_cache_stats().items()}
+    caches.update(pdf_ops=PDF_OPS_CACHE.stats(), polygons=POLYGON_CACHE.stats(),
+                  svg_paths=SVG_PATH_CACHE.stats(), batch_renderers=RENDERER_CACHE.stats())
+    # Модуль анимации грузится при первом задании обучения
+    animation = sys.modules.get("training_animation")
+    if animation is not None:
+        caches["frames"] = animation.FRAME_CACHE.stats()
+    caches.update({f"preview_{name}": stats for name, stats in preview_stats().items()})
+    families = metrics.cache_samples(caches)
+
+    outputs = output_stats()
+    families.append(("output_cache_total", "counter", "Готовые форматы: попадания и промахи",
+                     [((("result", name),), value) for name, value in sorted(outputs.items())]))
+
+    jobs = job_queue.metrics()
+    families.append(("jobs_total", "counter", "Задания пула по исходу",
+                     [((("result", name),), jobs[name])
+                      for name in ("submitted", "rejected", "failed")]))
+    families.append(("jobs_in_flight", "gauge", "Задания в работе и в очереди",
+                     [((("state", "running"),), jobs["running"]),
+                      ((("state", "queued"),), jobs["queued"])]))
+
+    store = result_store.stats()
+    families.append(("store_renders", "gauge", "Рендеров в хранилище",
+                     [((), store["renders"])]))
+    families.append(("store_bytes", "gauge", "Байт в хранилище", [((), store["bytes"])]))
+    return families
+
+@app.route("/metrics")
+def metrics_route():
+    """
+    Метрики воркера в текстовом формате Prometheus: этапы рендера, запросы,
+    примитивы страниц (отрезки сетки, контуры букв, точки), записанные байты,
+    кэши, очередь и хранилище.
+    """
+    return Response(metrics.render_prometheus(_extra_metrics()), content_type=metrics.CONTENT_TYPE)
 
 
 # ------------------------------------------------
@@ -0,0 +1,191 @@
+# batch.py — пакетная генерация листов по манифесту JSON Lines
+#  Одна строка манифеста — один лист (текст, шрифт, параметры); результат — ZIP-архив
+#
+#  Запуск из командной строки:
+#      python batch.py class_5a.jsonl -o class_5a.zip
+#
+#  Пример строки манифеста:
+#      {"name": "ivanov", "text": "Иванов Иван\nЗадание 1", "font": "GOST.ttf",
+#       "font_size": 7, "formats": ["pdf", "png"]}
+
+import argparse
+import json
+import os
+import re
+import sys
+
+from matplotlib.colors import is_color_like
+
+from font_on_temp5_to_gost import DEFAULT_SPACING, DEFAULT_FONT_SIZE, LRUCache
+from render_service import (FORMATS, RENDERER_KEYS, build_renderer, render_flags,
+                            render_format, normalize_params, validate_params)
+from pdf_renderer import stream_pdf
+from zip_stream import stream_zip
+
+# ------------------ Константы ------------------
+FONTS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "fonts")
+DEFAULT_FONT = "GOST.ttf"
+BATCH_FORMATS = tuple(FORMATS) + ("document",)   # document — многостраничный PDF
+DEFAULT_FORMATS = ("pdf",)
+ERRORS_FILE = "errors.jsonl"
+
+# Флаги в манифесте — JSON-булевы; строки "false"/"0" не должны становиться True
+FLAG_STRINGS = {"true": True, "1": True, "yes": True, "on": True,
+                "false": False, "0": False, "no": False, "off": False}
+
+# Отрисовщики с одинаковыми настройками общие для всего пакета:
+# шрифт загружается и масштаб считается один раз, кэши контуров слов общие
+RENDERER_CACHE = LRUCache(32)
+
+class ManifestError(ValueError):
+    """
+    Строка манифеста не разобрана или содержит недопустимые параметры.
+    """
+
+# ------------------ Разбор манифеста ------------------
+def _font_path(font):
+    # Только файлы из папки fonts/, регистр имени не важен
+    available = {f.lower(): f for f in os.listdir(FONTS_DIR)
+                 if f.lower().endswith((".ttf", ".otf"))}
+    name = available.get(os.path.basename(str(font)).lower())
+    if name is None:
+        raise ManifestError(f"Шрифт не найден: {font}")
+    return os.path.join(FONTS_DIR, name)
+
+def _safe_name(name, number):
+    name = re.sub(r"[^\w.-]+", "_", str(name or "")).strip("._")
+    return name or f"sheet_{number:04d}"
+
+def _flag(entry, name, default):
+    value = entry.get(name, default)
+    if isinstance(value, bool):
+        return value
+    if isinstance(value, int) and value in (0, 1):
+        return bool(value)
+    if isinstance(value, str) and value.strip().lower() in FLAG_STRINGS:
+        return FLAG_STRINGS[value.strip().lower()]
+    raise ManifestError(f"{name}: ожидается true или false, получено {value!r}")
+
+def _color(entry, name, default):
+    # Цвет проверяется при разборе: ошибка посреди потокового PDF оборвала бы архив
+    value = str(entry.get(name, default))
+    if not is_color_like(value):
+        raise ManifestError(f"{name}: некорректный цвет {value!r}")
+    return value
+
+def entry_params(entry):
+    """
+    Параметры рендера для строки манифеста; значения по умолчанию — как у формы.
+    """
+    if not isinstance(entry, dict):
+        raise ManifestError("Строка манифеста должна быть JSON-объектом")
+    if "lines" in entry:
+        lines = [str(line).strip() for line in entry["lines"] if str(line).strip()]
+    else:
+        lines = [ln.strip() for ln in str(entry.get("text", "")).splitlines() if ln.strip()]
+    font_path = _font_path(entry.get("font", DEFAULT_FONT))
+    try:
+        font_size = float(entry.get("font_size", DEFAULT_FONT_SIZE))
+        auto_step = round(font_size / 14.0, 1)
+        line_width = entry.get("line_width")
+        params = dict(
+            lines=lines,
+            font_path=font_path,
+            spacing=float(entry.get("spacing", DEFAULT_SPACING)),
+            font_size=font_size,
+            line_width=auto_step if line_width is None else float(line_width),
+            frame_color=_color(entry, "frame_color", "#B3E5FC"),
+            grid_color=_color(entry, "grid_color", "#81D4FA"),
+            font_color=_color(entry, "font_color", "lightgray"),
+            show_grid=_flag(entry, "show_grid", True),
+            show_font=_flag(entry, "show_font", True),
+            dots_only=_flag(entry, "dots_only", False),
+            classic_grid=_flag(entry, "classic_grid", False),
+            thin_step_h=float(entry.get("thin_step_h", auto_step)),
+            thin_step_v=float(entry.get("thin_step_v", auto_step)),
+        )
+        validate_params(params)
+    except ManifestError:
+        raise
+    except (TypeError, ValueError) as e:
+        raise ManifestError(f"Некорректный параметр: {e}") from e
+    return normalize_params(params)
+
+def entry_formats(entry):
+    formats = entry.get("formats", DEFAULT_FORMATS)
+    if isinstance(formats, str):
+        formats = [f for f in formats.split(",") if f]
+    unknown = [f for f in formats if f not in BATCH_FORMATS]
+    if unknown:
+        raise ManifestError(f"Неизвестные форматы: {', '.join(map(str, unknown))}")
+    return list(dict.fromkeys(formats))
+
+# ------------------ Рендер пакета ------------------
+def shared_renderer(params):
+    key = tuple(params[k] for k in RENDERER_KEYS)
+    return RENDERER_CACHE.get(key, lambda: build_renderer(params))
+
+def batch_files(manifest_lines):
+    """
+    Генератор пар (имя в архиве, содержимое) по строкам манифеста.
+    Ошибочные строки не прерывают пакет: они собираются в errors.jsonl.
+    """
+    errors, used = [], set()
+    for number, raw in enumerate(manifest_lines, start=1):
+        raw = raw.strip()
+        if not raw or raw.startswith("#"):
+            continue
+        try:
+            entry = json.loads(raw)
+            params = entry_params(entry)
+            formats = entry_formats(entry)
+        except (ValueError, ManifestError) as e:
+            errors.append({"line": number, "error": str(e)})
+            continue
+
+        base = _safe_name(entry.get("name"), number)
+        if base in used:
+            base = f"{base}_{number}"
+        used.add(base)
+
+        renderer = shared_renderer(params)
+        flags = render_flags(params)
+        layout = None
+        for fmt in formats:
+            if fmt == "document":
+                # Многостраничный PDF пишется в архив по страницам
+                yield f"{base}.document.pdf", stream_pdf(
+                    renderer, renderer.layout_pages(params["lines"]), **flags)
+                continue
+            if layout is None:
+                layout = renderer.layout(params["lines"])
+            try:
+                yield f"{base}.{fmt}", render_format(renderer, layout, flags, fmt)
+            except Exception as e:
+                errors.append({"line": number, "name": base, "format": fmt, "error": str(e)})
+
+    if errors:
+        yield ERRORS_FILE, "".join(json.dumps(e, ensure_ascii=False) + "\n"
+                                   for e in errors).encode("utf-8")
+
+def stream_batch(manifest_lines):
+    """
+    Генератор байтов ZIP-архива со всеми листами манифеста.
+    """
+    return stream_zip(batch_files(manifest_lines))
+
+# ------------------ Командная строка ------------------
+def main():
+    parser = argparse.ArgumentParser(description="Пакетная генерация листов по манифесту JSON Lines")
+    parser.add_argument("manifest", help="файл .jsonl, '-' — стандартный ввод")
+    parser.add_argument("-o", "--output", default="batch.zip", help="ZIP-архив результата")
+    args = parser.parse_args()
+
+    source = sys.stdin if args.manifest == "-" else open(args.manifest, encoding="utf-8")
+    with source, open(args.output, "wb") as out:
+        for chunk in stream_batch(source):
+            out.write(chunk)
+    print(f"✅ Архив сохранён: {args.output}")
+
+if __name__ == "__main__":
+    main()
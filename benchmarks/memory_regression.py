@@ -0,0 +1,75 @@
+# memory_regression.py — проверка, что память воркера не растёт от рендера к рендеру
+#  Рендерит N листов подряд и сравнивает RSS после прогрева и в конце
+#
+#  Запуск из корня репозитория:
+#      python benchmarks/memory_regression.py --sheets 200 --max-growth-mb 20
+
+import argparse
+import gc
+import os
+import sys
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from font_on_temp5_to_gost import TextRenderer, figure_bytes
+
+# ------------------ Константы ------------------
+FONT_PATH = os.path.join(ROOT, "fonts", "GOST.ttf")
+TEXT = ["Съешь же ещё этих мягких", "французских булок", "да выпей чаю"]
+WARMUP_SHEETS = 10
+
+# ------------------ Замер памяти ------------------
+def rss_mb():
+    """
+    Текущий RSS процесса в МБ (Linux — /proc, иначе пиковый ru_maxrss).
+    """
+    try:
+        with open("/proc/self/statm") as fh:
+            pages = int(fh.read().split()[1])
+        return pages * os.sysconf("SC_PAGE_SIZE") / 2 ** 20
+    except (OSError, ValueError):
+        import resource
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        return peak / 2 ** 20 if sys.platform == "darwin" else peak / 1024
+
+def render_sheet(renderer, fmt, dpi):
+    fig = renderer.render_to_figure(TEXT, classic_grid=True)
+    return figure_bytes(fig, fmt, dpi=dpi)
+
+# ------------------ Запуск ------------------
+def main():
+    parser = argparse.ArgumentParser(description="Регрессия памяти при рендере листов")
+    parser.add_argument("--sheets", type=int, default=200)
+    parser.add_argument("--format", default="png", choices=("png", "pdf", "svg"))
+    parser.add_argument("--dpi", type=int, default=100)
+    parser.add_argument("--max-growth-mb", type=float, default=20.0)
+    parser.add_argument("--font", default=FONT_PATH)
+    args = parser.parse_args()
+
+    renderer = TextRenderer(args.font)
+    for _ in range(WARMUP_SHEETS):
+        render_sheet(renderer, args.format, args.dpi)
+    gc.collect()
+    baseline = rss_mb()
+
+    started = time.perf_counter()
+    for i in range(1, args.sheets + 1):
+        render_sheet(renderer, args.format, args.dpi)
+        if i % 50 == 0:
+            print(f"{i:5d} листов: RSS {rss_mb():.1f} МБ")
+    elapsed = time.perf_counter() - started
+    gc.collect()
+    growth = rss_mb() - baseline
+
+    print(f"Листов: {args.sheets}, {elapsed / args.sheets * 1000:.1f} мс/лист")
+    print(f"RSS после прогрева: {baseline:.1f} МБ, прирост: {growth:+.1f} МБ")
+    if growth > args.max_growth_mb:
+        print(f"❌ Память растёт: прирост больше {args.max_growth_mb} МБ")
+        return 1
+    print("✅ Память стабильна")
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
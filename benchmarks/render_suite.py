@@ -0,0 +1,307 @@
+# render_suite.py — воспроизводимые замеры этапов рендера по всем шрифтам
+#  Фиксированные тексты × варианты листа × шрифты из fonts/ -> JSON с временем,
+#  пиковым RSS, числом artist-объектов и размером результата на каждый этап
+#
+#  Запуск из корня репозитория:
+#      python benchmarks/render_suite.py -o benchmarks/results/latest.json
+#      python benchmarks/render_suite.py --fonts GOST.ttf --corpora form --repeat 5
+#      python benchmarks/render_suite.py --baseline benchmarks/results/main.json --tolerance 0.25
+
+import argparse
+import contextlib
+import datetime
+import gc
+import json
+import os
+import platform
+import resource
+import sys
+import time
+from itertools import cycle, islice
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+import matplotlib
+import numpy as np
+import PIL
+
+import font_on_temp5_to_gost as gost
+import pdf_renderer
+import raster_renderer
+import svg_renderer
+import training_animation
+from batch import entry_params
+from font_on_temp5_to_gost import (DEFAULT_ANGLE, new_figure, figure_bytes, release_figure,
+                                   draw_grid_in_boxes, measure_line_total_width)
+from render_service import build_renderer, render_flags, render_format
+
+# ------------------ Константы ------------------
+FONTS_DIR = os.path.join(ROOT, "fonts")
+DEFAULT_OUTPUT = os.path.join("benchmarks", "results", "latest.json")
+DEFAULT_REPEAT = 3
+MIN_DELTA_S = 0.005      # разница меньше этой не считается регрессией
+DOCUMENT_PAGES = 100
+
+# Текст формы по умолчанию (см. HTML_FORM в app.py)
+FORM_TEXT = [
+    "Программа",
+    "для обучения и тестирования",
+    "навыков написания шрифта для",
+    "начинающих изучать черчение,",
+    "автор - Mike Yakutsenak.",
+    "Proprietary software 2025.",
+]
+
+# Кириллический текст: из него собираются страница и документ
+CYRILLIC_TEXT = [
+    "Съешь же ещё этих мягких французских булок",
+    "да выпей чаю. В чащах юга жил бы цитрус?",
+    "Да, но фальшивый экземпляр! Эх, жирафы",
+    "честно в цепи, но щук объять за миг.",
+    "Широкая электрификация южных губерний",
+    "даст мощный толчок подъёму сельского хозяйства.",
+    "Любя, съешь щипцы, — вздохнёт мэр, — кайф жгуч.",
+    "Шеф взъярён тчк щипцы с эхом гудбай Жюль.",
+]
+
+VARIANTS = {
+    "default": {},
+    "dots_only": {"dots_only": True},
+    "classic_grid": {"classic_grid": True},
+}
+
+# Кэши, которые сбрасываются перед холодным прогоном этапа
+CACHES = (gost.WORD_CACHE, gost.METRICS_CACHE, gost.SCALE_CACHE,
+          pdf_renderer.PDF_OPS_CACHE, raster_renderer.POLYGON_CACHE,
+          svg_renderer.SVG_PATH_CACHE, training_animation.FRAME_CACHE)
+
+# ------------------ Тексты ------------------
+def page_lines(font_size=gost.DEFAULT_FONT_SIZE):
+    """
+    Ровно одна полная страница кириллического текста.
+    """
+    _, count = gost.page_baselines(gost.frame_bounds(gost.DEFAULT_PAGE_W, gost.DEFAULT_PAGE_H),
+                                   gost.DEFAULT_LINE_STEP, font_size)
+    return list(islice(cycle(CYRILLIC_TEXT), count))
+
+def document_lines(pages=DOCUMENT_PAGES, font_size=gost.DEFAULT_FONT_SIZE):
+    """
+    Текст ровно на pages страниц — как загруженный .txt большого задания.
+    """
+    lines = []
+    for number, (_, chunk) in enumerate(gost.paginate(cycle(CYRILLIC_TEXT), font_size), 1):
+        lines.extend(chunk)
+        if number == pages:
+            return lines
+
+CORPORA = {
+    "form": lambda: FORM_TEXT,
+    "page": page_lines,
+    "document": document_lines,
+}
+
+# ------------------ Замеры ------------------
+def clear_caches():
+    for cache in CACHES:
+        cache.clear()
+
+def reset_peak_rss():
+    # Linux: "5" в clear_refs сбрасывает VmHWM; иначе пик считается с начала процесса
+    try:
+        with open("/proc/self/clear_refs", "w") as fh:
+            fh.write("5")
+    except OSError:
+        pass
+
+def peak_rss_mb():
+    try:
+        with open("/proc/self/status") as fh:
+            for line in fh:
+                if line.startswith("VmHWM:"):
+                    return int(line.split()[1]) / 1024
+    except OSError:
+        pass
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak / 2 ** 20 if sys.platform == "darwin" else peak / 1024
+
+def count_artists(fig):
+    return sum(len(ax.patches) + len(ax.lines) + len(ax.collections) + len(ax.texts)
+               + len(ax.images) for ax in fig.axes)
+
+def measure(stage, repeat, prepare=None):
+    """
+    Прогоняет этап repeat раз: первый прогон — с пустыми кэшами.
+    stage(state) возвращает словарь метрик результата (bytes, artists, ...).
+    prepare() готовит входные данные вне замера.
+    """
+    times, info = [], {}
+    clear_caches()
+    gc.collect()
+    reset_peak_rss()
+    for _ in range(repeat):
+        state = prepare() if prepare else None
+        started = time.perf_counter()
+        info = stage(state) or {}
+        times.append(time.perf_counter() - started)
+    return dict(info, cold_s=round(times[0], 6), wall_s=round(min(times), 6),
+                peak_rss_mb=round(peak_rss_mb(), 1))
+
+# ------------------ Этапы ------------------
+def _figure_stage(renderer, lines, flags):
+    def stage(_):
+        fig = renderer.render_to_figure(lines, **flags)
+        artists = count_artists(fig)
+        release_figure(fig)
+        return {"artists": artists}
+    return stage
+
+def _savefig_stage(fmt):
+    def stage(fig):
+        return {"bytes": len(figure_bytes(fig, fmt))}
+    return stage
+
+def _grid_stage(renderer, layout, flags):
+    def stage(_):
+        fig = new_figure(layout.page_w, layout.page_h, dpi=renderer.dpi)
+        ax = fig.add_axes([0, 0, 1, 1])
+        draw_grid_in_boxes(ax, layout.boxes, None, *layout.frame,
+                           thin_step_h=flags["thin_step_h"], thin_step_v=flags["thin_step_v"],
+                           angle=DEFAULT_ANGLE, color=renderer.grid_color,
+                           classic=flags["classic_grid"])
+        artists = count_artists(fig)
+        release_figure(fig)
+        return {"artists": artists}
+    return stage
+
+def sheet_stages(params, repeat):
+    """
+    Этапы одностраничного листа: замер, раскладка, matplotlib-фигура,
+    три формата savefig и прямые рендереры, которые отдаёт приложение.
+    """
+    renderer = build_renderer(params)
+    lines = params["lines"]
+    flags = render_flags(params)
+    layout = renderer.layout(lines)
+    yield "measure_line_total_width", measure(lambda _: {"lines": len(
+        [measure_line_total_width(ln, renderer.scale, renderer.font, renderer.spacing)
+         for ln in lines])}, repeat)
+    yield "layout", measure(lambda _: {"lines": len(renderer.layout(lines).lines)}, repeat)
+    if flags["show_grid"] and not flags["dots_only"]:
+        yield "draw_grid_in_boxes", measure(_grid_stage(renderer, layout, flags), repeat)
+    yield "render_to_figure", measure(_figure_stage(renderer, lines, flags), repeat)
+    for fmt in ("png", "pdf", "svg"):
+        yield f"savefig_{fmt}", measure(_savefig_stage(fmt), repeat,
+                                        prepare=lambda: renderer.render_to_figure(lines, **flags))
+    for fmt in ("pdf", "png", "svg"):
+        yield f"render_{fmt}", measure(
+            lambda _, fmt=fmt: {"bytes": len(render_format(renderer, renderer.layout(lines),
+                                                           flags, fmt))}, repeat)
+
+def document_stages(params, repeat):
+    """
+    Этапы многостраничного документа: постраничная раскладка и потоковый PDF.
+    """
+    renderer = build_renderer(params)
+    lines = params["lines"]
+    flags = render_flags(params)
+    yield "layout_pages", measure(
+        lambda _: {"pages": sum(1 for _ in renderer.layout_pages(lines))}, repeat)
+    yield "stream_pdf", measure(
+        lambda _: {"bytes": sum(len(chunk) for chunk in pdf_renderer.stream_pdf(
+            renderer, renderer.layout_pages(lines), **flags))}, repeat)
+
+def training_stage(lines, repeat):
+    def stage(_):
+        # Предупреждения о буквах без изображений в замер не выводим
+        with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull):
+            return {"bytes": len(training_animation.animation_bytes(lines) or b"")}
+    return measure(stage, repeat)
+
+# ------------------ Запуск ------------------
+def environment():
+    return {
+        "timestamp": datetime.datetime.now().isoformat(timespec="seconds"),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "cpu_count": os.cpu_count(),
+        "numpy": np.__version__,
+        "matplotlib": matplotlib.__version__,
+        "pillow": PIL.__version__,
+    }
+
+def run_suite(fonts, corpora, variants, repeat, log=print):
+    results = []
+
+    def record(font, corpus, variant, stage, info):
+        row = dict(font=font, corpus=corpus, variant=variant, stage=stage, **info)
+        results.append(row)
+        extra = "  ".join(f"{k}={row[k]}" for k in ("artists", "bytes", "pages") if k in row)
+        log(f"{font:24s} {corpus:9s} {variant:12s} {stage:26s} "
+            f"{row['wall_s'] * 1000:9.1f} мс  RSS {row['peak_rss_mb']:7.1f} МБ  {extra}")
+
+    texts = {name: CORPORA[name]() for name in corpora}
+    for font in fonts:
+        for corpus, lines in texts.items():
+            for variant in variants:
+                params = entry_params(dict(VARIANTS[variant], lines=lines, font=font))
+                stages = document_stages if corpus == "document" else sheet_stages
+                for stage, info in stages(params, repeat):
+                    record(font, corpus, variant, stage, info)
+    # Анимация обучения не зависит от шрифта и варианта листа
+    for corpus, lines in texts.items():
+        if corpus != "document":
+            record("letter_images", corpus, "default", "training_animation",
+                   training_stage(lines, repeat))
+    return results
+
+def compare(results, baseline, tolerance):
+    """
+    Сравнивает wall_s с базовым прогоном; возвращает список регрессий.
+    """
+    def key(row):
+        return row["font"], row["corpus"], row["variant"], row["stage"]
+
+    base = {key(row): row for row in baseline["results"]}
+    regressions = []
+    for row in results:
+        old = base.get(key(row))
+        if old is None:
+            continue
+        delta = row["wall_s"] - old["wall_s"]
+        if delta > MIN_DELTA_S and row["wall_s"] > old["wall_s"] * (1.0 + tolerance):
+            regressions.append((key(row), old["wall_s"], row["wall_s"]))
+    return regressions
+
+def main():
+    fonts_available = sorted(f for f in os.listdir(FONTS_DIR) if f.lower().endswith((".ttf", ".otf")))
+    parser = argparse.ArgumentParser(description="Замеры этапов рендера по всем шрифтам")
+    parser.add_argument("-o", "--output", default=DEFAULT_OUTPUT, help="JSON с результатами")
+    parser.add_argument("--fonts", nargs="+", default=fonts_available)
+    parser.add_argument("--corpora", nargs="+", default=list(CORPORA), choices=list(CORPORA))
+    parser.add_argument("--variants", nargs="+", default=list(VARIANTS), choices=list(VARIANTS))
+    parser.add_argument("--repeat", type=int, default=DEFAULT_REPEAT)
+    parser.add_argument("--baseline", help="JSON прошлого прогона для сравнения")
+    parser.add_argument("--tolerance", type=float, default=0.25,
+                        help="допустимое замедление этапа (0.25 — на 25%%)")
+    args = parser.parse_args()
+
+    results = run_suite(args.fonts, args.corpora, args.variants, max(args.repeat, 1))
+    report = {"environment": environment(), "repeat": args.repeat, "results": results}
+    os.makedirs(os.path.dirname(os.path.abspath(args.output)), exist_ok=True)
+    with open(args.output, "w", encoding="utf-8") as fh:
+        json.dump(report, fh, ensure_ascii=False, indent=1)
+    print(f"✅ Результаты сохранены: {args.output}")
+
+    if args.baseline:
+        with open(args.baseline, encoding="utf-8") as fh:
+            regressions = compare(results, json.load(fh), args.tolerance)
+        for (font, corpus, variant, stage), old, new in regressions:
+            print(f"❌ {font} {corpus} {variant} {stage}: {old * 1000:.1f} -> {new * 1000:.1f} мс")
+        if regressions:
+            return 1
+        print("✅ Регрессий нет")
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
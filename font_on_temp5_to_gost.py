@@ -1,13 +1,22 @@
 # Font_on_TEMP5_to_GOST.py (точки теперь точно в начале каждого слова)
 #  Сетка меняется
 
-import matplotlib.pyplot as plt
-from matplotlib.patches import Rectangle, PathPatch, Circle
+from matplotlib.figure import Figure
+from matplotlib.backends.backend_agg import FigureCanvasAgg
+from matplotlib.patches import Rectangle, PathPatch
+from matplotlib.collections import LineCollection, EllipseCollection
 from matplotlib.textpath import TextPath
-from matplotlib.font_manager import FontProperties
+from matplotlib.font_manager import FontProperties, findfont, get_font
 from matplotlib.transforms import Affine2D
 import numpy as np
+import io
 import re
+import threading
+from collections import OrderedDict
+from itertools import islice
+
+from glyph_atlas import get_atlas, segment_cumsum
+import metrics
 
 # ------------------ Константы ------------------
 MM_INCH = 25.4
@@ -17,6 +26,16 @@ DEFAULT_LINE_STEP = 15.5
 DEFAULT_THIN_STEP = 1.4
 DEFAULT_ANGLE = -15
 CORRECTION_K = 0.7
+GRID_LINE_WIDTH = 0.1
+FRAME_LINE_WIDTH = 1.4
+DOT_EDGE_WIDTH = 1.0
+GRID_MODES = ("lines", "batched", "analytic")
+DEFAULT_GRID_MODE = "analytic"
+WORD_CACHE_SIZE = 4096
+METRICS_CACHE_SIZE = 65536   # метрики слов вне атласа: два числа на слово
+SCALE_CACHE_SIZE = 256
+PREWARM_TEXT = "ГОСТ 2.304-81 Шрифты чертёжные abc XYZ"   # образец для прогрева шрифтов
+LAYOUT_BATCH_LINES = 4096   # строк в одном векторном замере постраничной раскладки
 
 DEFAULT_SPACING = 4.2
 DEFAULT_FONT_SIZE = 10.0
@@ -29,32 +48,175 @@ DEFAULT_FONT_COLOR = "lightgray"
 def mm_figsize(w_mm, h_mm):
     return (w_mm / MM_INCH, h_mm / MM_INCH)
 
+def new_figure(w_mm, h_mm, dpi=DEFAULT_DPI):
+    """
+    Отдельная фигура на Agg-холсте, без pyplot: она не регистрируется
+    в глобальном менеджере фигур и освобождается сборщиком мусора.
+    """
+    fig = Figure(figsize=mm_figsize(w_mm, h_mm), dpi=dpi)
+    FigureCanvasAgg(fig)
+    return fig
+
+def release_figure(fig):
+    """
+    Разрывает ссылки фигуры на оси и художников, чтобы память
+    вернулась сразу, а не при следующем проходе сборщика циклов.
+    """
+    fig.clear()
+    fig.canvas = None
+
+def figure_bytes(fig, fmt, **savefig_kwargs):
+    """
+    Сериализует фигуру в байты формата fmt и освобождает её.
+    """
+    try:
+        buf = io.BytesIO()
+        fig.savefig(buf, format=fmt, **savefig_kwargs)
+        return buf.getvalue()
+    finally:
+        release_figure(fig)
+
+def frame_bounds(page_w, page_h, left=20, right=5, top=5, bottom=5):
+    return left, bottom, page_w - right, page_h - top
+
 def draw_frame(ax, page_w, page_h, color, left=20, right=5, top=5, bottom=5):
-    x0, y0 = left, bottom
-    x1, y1 = page_w - right, page_h - top
+    x0, y0, x1, y1 = frame_bounds(page_w, page_h, left, right, top, bottom)
     frame = Rectangle((x0, y0), x1 - x0, y1 - y0,
-                      linewidth=1.4, edgecolor=color, facecolor="none",
+                      linewidth=FRAME_LINE_WIDTH, edgecolor=color, facecolor="none",
                       transform=ax.transData)
     ax.add_patch(frame)
     return frame, x0, y0, x1, y1
 
-def get_text_scale(cap_height_mm, fontprops):
-    tp = TextPath((0, 0), "A", size=100, prop=fontprops)
+# ------------------ Кэш контуров и метрик ------------------
+class LRUCache:
+    """
+    Ограниченный потокобезопасный LRU-кэш со счётчиками попаданий,
+    промахов и вытеснений. Общий для всех строк, запросов и отрисовщиков.
+    """
+
+    def __init__(self, maxsize):
+        self.maxsize = maxsize
+        self._items = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, key, build):
+        """
+        Возвращает значение по ключу; при промахе вычисляет его через build().
+        """
+        with self._lock:
+            if key in self._items:
+                self._items.move_to_end(key)
+                self.hits += 1
+                return self._items[key]
+            self.misses += 1
+        # Строим вне блокировки: контур слова считается дольше поиска в кэше
+        value = build()
+        with self._lock:
+            self._items[key] = value
+            self._items.move_to_end(key)
+            while len(self._items) > self.maxsize:
+                self._items.popitem(last=False)
+                self.evictions += 1
+        return value
+
+    def clear(self):
+        with self._lock:
+            self._items.clear()
+            self.hits = self.misses = self.evictions = 0
+
+    def stats(self):
+        with self._lock:
+            return {"size": len(self._items), "maxsize": self.maxsize,
+                    "hits": self.hits, "misses": self.misses,
+                    "evictions": self.evictions}
+
+WORD_CACHE = LRUCache(WORD_CACHE_SIZE)
+METRICS_CACHE = LRUCache(METRICS_CACHE_SIZE)
+SCALE_CACHE = LRUCache(SCALE_CACHE_SIZE)
+
+def cache_stats():
+    """
+    Счётчики кэшей раскладки: контуры и метрики слов, масштабы шрифтов.
+    """
+    return {"words": WORD_CACHE.stats(), "metrics": METRICS_CACHE.stats(),
+            "scales": SCALE_CACHE.stats()}
+
+def _font_key(fontprops):
+    # Шрифт из файла однозначно задаётся путём к .ttf
+    return fontprops.get_file() or fontprops
+
+def _text_path(text, fontprops):
+    """
+    Контур текста размера 100 pt. Для шрифта из файла он собирается
+    из атласа глифов без разбора шрифта; иначе — через TextPath.
+    FT2Font копит загруженные глифы, пока его не очистят, а TextPath
+    этого не делает — без clear() память воркера растёт с каждым словом.
+    """
+    font_file = fontprops.get_file()
+    atlas = get_atlas(font_file) if font_file else None
+    path = atlas.text_path(text) if atlas is not None else None
+    if path is not None:
+        return path
+    try:
+        return TextPath((0, 0), text, size=100, prop=fontprops)
+    finally:
+        get_font(findfont(fontprops)).clear()
+
+def _build_text_scale(cap_height_mm, fontprops):
+    tp = _text_path("A", fontprops)
     bb = tp.get_extents()
     height_pt = (bb.y1 - bb.y0)
     return cap_height_mm / height_pt if height_pt > 0 else 1.0
 
-def _word_path(word, scale, fontprops):
-    tp = TextPath((0, 0), word, size=100, prop=fontprops)
+def get_text_scale(cap_height_mm, fontprops):
+    key = (_font_key(fontprops), cap_height_mm)
+    return SCALE_CACHE.get(key, lambda: _build_text_scale(cap_height_mm, fontprops))
+
+def _build_word_path(word, scale, fontprops):
+    tp = _text_path(word, fontprops)
     verts = tp.vertices
+    if not len(verts):
+        # В шрифте нет ни одного глифа слова — пустой контур нулевой ширины
+        return tp, 0.0, 0.0
     x0, x1 = np.min(verts[:, 0]), np.max(verts[:, 0])
     width_mm = (x1 - x0) * scale
     tp_scaled = tp.transformed(Affine2D().scale(scale))
     tp_aligned = tp_scaled.transformed(Affine2D().translate(-x0 * scale, 0))
     return tp_aligned, width_mm, x0 * scale
 
+def _build_word_metrics(word, scale, fontprops):
+    # Те же ширина и смещение, что у _build_word_path, но без масштабированных копий контура
+    verts = _text_path(word, fontprops).vertices
+    if not len(verts):
+        return 0.0, 0.0
+    x0, x1 = np.min(verts[:, 0]), np.max(verts[:, 0])
+    return (x1 - x0) * scale, x0 * scale
+
+def _word_metrics(word, scale, fontprops):
+    """
+    Только метрики слова (w_mm, x_offset) — для слов вне атласа глифов.
+    В кэше лежат два числа, а не контур.
+    """
+    key = (_font_key(fontprops), scale, word)
+    return METRICS_CACHE.get(key, lambda: _build_word_metrics(word, scale, fontprops))
+
+def _word_path(word, scale, fontprops):
+    """
+    Контур слова в мм и его метрики из общего кэша.
+    Масштаб однозначно задан высотой прописных букв, поэтому ключ —
+    (файл шрифта, масштаб, слово). Возвращаемый Path изменять нельзя.
+    """
+    key = (_font_key(fontprops), scale, word)
+    return WORD_CACHE.get(key, lambda: _build_word_path(word, scale, fontprops))
+
+def split_words(text):
+    return [w for w in re.split(r"\s+", text.strip()) if w]
+
 def measure_line_total_width(text, scale, fontprops, spacing_mm):
-    words = [w for w in re.split(r"\s+", text.strip()) if w]
+    words = split_words(text)
     if not words:
         return 0.0, []
     parts, total_w = [], 0.0
@@ -66,22 +228,314 @@ def measure_line_total_width(text, scale, fontprops, spacing_mm):
     total_w += spacing_corr * (len(words) - 1)
     return total_w, parts
 
+def measure_lines(lines, scale, fontprops, spacing_mm):
+    """
+    Векторный замер строк: ширины и смещения контуров слов и полные
+    ширины строк — одним проходом по массивам метрик глифов
+    из атласа. Результат тот же, что у measure_line_total_width() по границам
+    контуров, включая шаг пробела spacing_mm * CORRECTION_K.
+    Слова вне атласа замеряются по контуру (_word_path).
+    Возвращает (слова по строкам, ширины, смещения, ширины строк);
+    массивы слов плоские, по порядку строк.
+    """
+    words = [split_words(text) for text in lines]
+    counts = np.array([len(ws) for ws in words], np.int64)
+    flat = [w for ws in words for w in ws]
+
+    font_file = fontprops.get_file()
+    atlas = get_atlas(font_file) if font_file else None
+    if atlas is not None:
+        xmin, xmax = atlas.word_bounds(flat)
+        widths = (xmax - xmin) * scale
+        offsets = xmin * scale
+    else:
+        widths = np.full(len(flat), np.nan)
+        offsets = np.full(len(flat), np.nan)
+    for i in np.flatnonzero(np.isnan(widths)):
+        widths[i], offsets[i] = _word_metrics(flat[i], scale, fontprops)
+
+    spacing_corr = spacing_mm * CORRECTION_K
+    ends = np.cumsum(counts)
+    nonempty = counts > 0
+    # Ширина строки: слова подряд, затем пробелы — как в цикле "total_w += w_mm"
+    sums = segment_cumsum(widths, counts)
+    totals = np.zeros(len(lines))
+    totals[nonempty] = sums[ends[nonempty] - 1] + spacing_corr * (counts[nonempty] - 1)
+    return words, widths, offsets, totals
+
+# ------------------ Раскладка строк ------------------
+class LineLayout:
+    """
+    Раскладка одной строки: метрики слов, их позиции и бокс сетки.
+    Считается один раз и используется всеми проходами отрисовки;
+    контуры слов строятся лениво — только если буквы рисуются.
+    """
+
+    def __init__(self, text, y, total_w, widths, x_offsets, word_x, box,
+                 scale, fontprops, words=None):
+        self.text = text
+        self.words = split_words(text) if words is None else words
+        self.y = y
+        self.total_w = total_w
+        self.widths = widths        # ширины контуров слов, мм
+        self.x_offsets = x_offsets  # левый край контура от начала слова, мм
+        self.word_x = word_x        # левый край контура каждого слова, мм
+        self.box = box              # (x, y, w, h) бокса сетки
+        self.scale = scale
+        self.fontprops = fontprops
+        self._paths = None
+
+    @property
+    def paths(self):
+        if self._paths is None:
+            self._paths = [_word_path(w, self.scale, self.fontprops)[0] for w in self.words]
+        return self._paths
+
+    @property
+    def parts(self):
+        return list(zip(self.paths, self.widths, self.x_offsets))   # [(path_mm, w_mm, x_offset), ...]
+
+class PageLayout:
+    """
+    Раскладка страницы: рамка, строки и параметры шрифта, по которым она посчитана.
+    """
+
+    def __init__(self, lines, frame, center_x, base_y, line_step,
+                 fontprops, scale, cap_height_mm, spacing_mm, padding,
+                 page_w=DEFAULT_PAGE_W, page_h=DEFAULT_PAGE_H):
+        self.lines = lines
+        self.frame = frame      # (x0, y0, x1, y1)
+        self.center_x = center_x
+        self.base_y = base_y
+        self.line_step = line_step
+        self.fontprops = fontprops
+        self.scale = scale
+        self.cap_height_mm = cap_height_mm
+        self.spacing_mm = spacing_mm
+        self.padding = padding
+        self.page_w = page_w
+        self.page_h = page_h
+
+    @property
+    def boxes(self):
+        return [line.box for line in self.lines]
+
+def _line_layouts(lines, center_x, ys, scale, fontprops, spacing_mm, cap_height_mm,
+                  padding=2.0):
+    # Один векторный замер на все строки, дальше только нарезка массивов
+    words, widths, offsets, totals = measure_lines(lines, scale, fontprops, spacing_mm)
+    counts = np.array([len(ws) for ws in words], np.int64)
+    lefts = center_x - totals / 2.0
+    # Левые края слов: от края строки, затем "cursor_x += w_mm + spacing_corr"
+    steps = np.empty(len(widths))
+    steps[1:] = widths[:-1] + spacing_mm * CORRECTION_K
+    starts = np.cumsum(counts) - counts
+    steps[starts[counts > 0]] = lefts[counts > 0]
+    word_x = segment_cumsum(steps, counts)
+
+    laid_out = []
+    for text, line_words, y, total_w, left, start in zip(lines, words, ys, totals.tolist(),
+                                                         lefts.tolist(), starts.tolist()):
+        stop = start + len(line_words)
+        box = (left - padding, y - padding,
+               total_w + 2 * padding, cap_height_mm + 2 * padding)
+        laid_out.append(LineLayout(text, y, total_w,
+                                   widths[start:stop].tolist(),
+                                   offsets[start:stop].tolist(),
+                                   word_x[start:stop].tolist(),
+                                   box, scale, fontprops, line_words))
+    return laid_out
+
+def layout_line(text, center_x, y, scale, fontprops, spacing_mm, cap_height_mm,
+                padding=2.0):
+    return _line_layouts([text], center_x, [y], scale, fontprops, spacing_mm,
+                         cap_height_mm, padding)[0]
+
+def page_baselines(frame, line_step, cap_height_mm, padding=2.0, first_page=True):
+    """
+    Первая базовая линия страницы и число строк, чьи боксы целиком в рамке.
+    Первая страница начинается как одиночный лист (с 65% высоты),
+    следующие — от верхнего края рамки. Базовые линии кратны line_step.
+    """
+    x0, y0, x1, y1 = frame
+    if first_page:
+        start_y = y0 + (y1 - y0) * 0.65
+    else:
+        start_y = y1 - cap_height_mm - padding
+    base_y = start_y - (start_y % line_step)
+    count = int((base_y - padding - y0) // line_step) + 1
+    return base_y, max(count, 1)
+
+def layout_page(lines, scale, fontprops, spacing_mm, cap_height_mm, padding=2.0,
+                page_w=DEFAULT_PAGE_W, page_h=DEFAULT_PAGE_H,
+                line_step=DEFAULT_LINE_STEP, base_y=None):
+    """
+    Раскладывает строки на странице: один замер каждой строки на весь рендер.
+    """
+    x0, y0, x1, y1 = frame_bounds(page_w, page_h)
+    center_x = (x0 + x1) / 2.0
+    if base_y is None:
+        base_y, _ = page_baselines((x0, y0, x1, y1), line_step, cap_height_mm, padding)
+    lines = list(lines)
+    ys, y = [], base_y
+    for _ in lines:
+        ys.append(y)
+        y -= line_step
+    laid_out = _line_layouts(lines, center_x, ys, scale, fontprops, spacing_mm,
+                             cap_height_mm, padding)
+    return PageLayout(laid_out, (x0, y0, x1, y1), center_x, base_y, line_step,
+                      fontprops, scale, cap_height_mm, spacing_mm, padding,
+                      page_w, page_h)
+
+def paginate(lines, cap_height_mm, padding=2.0,
+             page_w=DEFAULT_PAGE_W, page_h=DEFAULT_PAGE_H,
+             line_step=DEFAULT_LINE_STEP):
+    """
+    Разбивает строки по страницам без замера текста.
+    Генератор пар (base_y, строки страницы); строк на странице столько,
+    сколько боксов помещается в рамку.
+    """
+    frame = frame_bounds(page_w, page_h)
+    lines = iter(lines)
+    first_page = True
+    while True:
+        base_y, count = page_baselines(frame, line_step, cap_height_mm, padding, first_page)
+        chunk = list(islice(lines, count))
+        if not chunk and not first_page:
+            return
+        yield base_y, chunk
+        if len(chunk) < count:
+            return
+        first_page = False
+
+def layout_pages(lines, scale, fontprops, spacing_mm, cap_height_mm, padding=2.0,
+                 page_w=DEFAULT_PAGE_W, page_h=DEFAULT_PAGE_H,
+                 line_step=DEFAULT_LINE_STEP):
+    """
+    Генератор раскладок страниц: строки переносятся на новую страницу,
+    когда бокс следующей строки выходит за рамку. Строки замеряются
+    одним векторным проходом на пачку страниц (до LAYOUT_BATCH_LINES строк),
+    поэтому память ограничена пачкой, а не длиной документа.
+    """
+    x0, y0, x1, y1 = frame_bounds(page_w, page_h)
+    center_x = (x0 + x1) / 2.0
+    pages = paginate(lines, cap_height_mm, padding, page_w, page_h, line_step)
+    while True:
+        batch, total = [], 0
+        for base_y, chunk in pages:
+            batch.append((base_y, chunk))
+            total += len(chunk)
+            if total >= LAYOUT_BATCH_LINES:
+                break
+        if not batch:
+            return
+        texts, ys = [], []
+        for base_y, chunk in batch:
+            texts.extend(chunk)
+            ys.extend(base_y - i * line_step for i in range(len(chunk)))
+        laid_out = _line_layouts(texts, center_x, ys, scale, fontprops, spacing_mm,
+                                 cap_height_mm, padding)
+        start = 0
+        for base_y, chunk in batch:
+            yield PageLayout(laid_out[start:start + len(chunk)], (x0, y0, x1, y1), center_x,
+                             base_y, line_step, fontprops, scale, cap_height_mm,
+                             spacing_mm, padding, page_w, page_h)
+            start += len(chunk)
+        if total < LAYOUT_BATCH_LINES:
+            return
+
 def compute_text_boxes(lines, center_x, base_y, line_step, scale, fontprops,
                        spacing_mm, cap_height_mm, padding=2.0):
     boxes = []
     y = base_y
     for line in lines:
-        total_w, _ = measure_line_total_width(line, scale, fontprops, spacing_mm)
-        x = center_x - total_w / 2.0 - padding
-        h = cap_height_mm + 2 * padding
-        y_box = y - padding
-        boxes.append((x, y_box, total_w + 2 * padding, h))
+        boxes.append(layout_line(line, center_x, y, scale, fontprops,
+                                 spacing_mm, cap_height_mm, padding).box)
         y -= line_step
     return boxes
 
+def grid_segments(x0, y0, x1, y1, thin_step_h, thin_step_v, angle, classic=False):
+    """
+    Векторно строит все линии сетки рамки.
+    Возвращает массив отрезков формы (N, 2, 2): [[xa, ya], [xb, yb]].
+    """
+    # Горизонтальные линии: накапливаем шаг так же, как цикл "y += thin_step_h"
+    n_h = int(np.floor((y1 - y0 + 1e-6) / thin_step_h)) + 2
+    ys = np.cumsum(np.r_[y0, np.full(n_h - 1, thin_step_h)])
+    ys = ys[ys <= y1 + 1e-6]
+    horizontal = np.empty((len(ys), 2, 2))
+    horizontal[:, :, 0] = (x0, x1)
+    horizontal[:, :, 1] = ys[:, None]
+
+    # Вертикальные или наклонные
+    height = y1 - y0
+    x_vals = np.arange(x0 - height, x1 + height, thin_step_v)
+    dx = 0.0 if classic else height * np.tan(np.radians(-angle))
+    slanted = np.empty((len(x_vals), 2, 2))
+    slanted[:, 0, 0] = x_vals
+    slanted[:, 1, 0] = x_vals + dx
+    slanted[:, :, 1] = (y0, y1)
+    return np.concatenate([horizontal, slanted])
+
+def clip_segments_to_box(segments, bx, by, bw, bh):
+    """
+    Аналитически обрезает отрезки прямоугольником (алгоритм Лианга — Барски).
+    Возвращает только видимые части отрезков, полностью внешние отбрасываются.
+    """
+    start = segments[:, 0, :]
+    delta = segments[:, 1, :] - start
+    p = np.stack([-delta[:, 0], delta[:, 0], -delta[:, 1], delta[:, 1]], axis=1)
+    q = np.stack([start[:, 0] - bx, bx + bw - start[:, 0],
+                  start[:, 1] - by, by + bh - start[:, 1]], axis=1)
+
+    parallel = p == 0
+    outside = np.any(parallel & (q < 0), axis=1)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        r = q / p
+    t0 = np.max(np.where(p < 0, r, 0.0), axis=1, initial=0.0)
+    t1 = np.min(np.where(p > 0, r, 1.0), axis=1, initial=1.0)
+
+    keep = ~outside & (t0 < t1)
+    start, delta = start[keep], delta[keep]
+    clipped = np.empty((len(start), 2, 2))
+    clipped[:, 0, :] = start + t0[keep, None] * delta
+    clipped[:, 1, :] = start + t1[keep, None] * delta
+    return clipped
+
 def draw_grid_in_boxes(ax, boxes, frame_rect, x0, y0, x1, y1,
                        thin_step_h, thin_step_v, angle, color,
-                       classic=False):
+                       classic=False, mode=DEFAULT_GRID_MODE):
+    """
+    Рисует сетку внутри каждого бокса.
+    mode="analytic" — отрезки заранее обрезаны по боксу, клип-путей нет,
+    mode="batched"  — одна LineCollection на бокс с одним клипом,
+    mode="lines"    — прежний вариант: отдельная Line2D на каждую линию.
+    """
+    if mode not in GRID_MODES:
+        raise ValueError(f"Неизвестный режим сетки: {mode}")
+    if mode == "analytic":
+        segments = grid_segments(x0, y0, x1, y1, thin_step_h, thin_step_v, angle, classic)
+        visible = [clip_segments_to_box(segments, *box) for box in boxes]
+        if visible:
+            # Концы линий "butt", чтобы штрих не выходил за границы бокса
+            lines = LineCollection(np.concatenate(visible), colors=color,
+                                   linewidths=GRID_LINE_WIDTH, capstyle="butt",
+                                   zorder=2, transform=ax.transData)
+            ax.add_collection(lines, autolim=False)
+        return
+    if mode == "batched":
+        segments = grid_segments(x0, y0, x1, y1, thin_step_h, thin_step_v, angle, classic)
+        for (bx, by, bw, bh) in boxes:
+            clip_rect = Rectangle((bx, by), bw, bh, facecolor='none', edgecolor='none',
+                                  transform=ax.transData)
+            ax.add_patch(clip_rect)
+            lines = LineCollection(segments, colors=color, linewidths=GRID_LINE_WIDTH,
+                                   capstyle="projecting", zorder=2,
+                                   transform=ax.transData)
+            ax.add_collection(lines, autolim=False)
+            lines.set_clip_path(clip_rect)
+        return
+
     for (bx, by, bw, bh) in boxes:
         clip_rect = Rectangle((bx, by), bw, bh, facecolor='none', edgecolor='none',
                               transform=ax.transData)
@@ -90,7 +544,7 @@ def draw_grid_in_boxes(ax, boxes, frame_rect, x0, y0, x1, y1,
         # Горизонтальные линии
         y = y0
         while y <= y1 + 1e-6:
-            line = ax.plot([x0, x1], [y, y], color=color, lw=0.1,
+            line = ax.plot([x0, x1], [y, y], color=color, lw=GRID_LINE_WIDTH,
                            clip_on=True, transform=ax.transData)[0]
             line.set_clip_path(clip_rect)
             y += thin_step_h
@@ -100,49 +554,54 @@ def draw_grid_in_boxes(ax, boxes, frame_rect, x0, y0, x1, y1,
         x_vals = np.arange(x0 - height, x1 + height, thin_step_v)
         if classic:
             for xv in x_vals:
-                line = ax.plot([xv, xv], [y0, y1], color=color, lw=0.1,
+                line = ax.plot([xv, xv], [y0, y1], color=color, lw=GRID_LINE_WIDTH,
                                clip_on=True, transform=ax.transData)[0]
                 line.set_clip_path(clip_rect)
         else:
             dx = height * np.tan(np.radians(-angle))
             for xv in x_vals:
-                line = ax.plot([xv, xv + dx], [y0, y1], color=color, lw=0.1,
+                line = ax.plot([xv, xv + dx], [y0, y1], color=color, lw=GRID_LINE_WIDTH,
                                clip_on=True, transform=ax.transData)[0]
                 line.set_clip_path(clip_rect)
 
-def draw_gost_text(ax, text, center_x, y, scale, fontprops,
-                   spacing_mm=DEFAULT_SPACING, line_width_mm=DEFAULT_LINE_WIDTH,
+def draw_line_text(ax, line, line_width_mm=DEFAULT_LINE_WIDTH,
                    cap_height_mm=DEFAULT_FONT_SIZE, edge_color=DEFAULT_FONT_COLOR):
-    words = [w for w in re.split(r"\s+", text.strip()) if w]
-    if not words:
-        return
-    total_w, parts = measure_line_total_width(text, scale, fontprops, spacing_mm)
-    cursor_x = center_x - total_w / 2.0
     gost_line_width = (cap_height_mm / 14.0) if line_width_mm is None else line_width_mm
-    spacing_corr = spacing_mm * CORRECTION_K
-    for i, (path_mm, w_mm, _) in enumerate(parts):
-        path_t = path_mm.transformed(Affine2D().translate(cursor_x, y))
+    for path_mm, cursor_x in zip(line.paths, line.word_x):
+        path_t = path_mm.transformed(Affine2D().translate(cursor_x, line.y))
         patch = PathPatch(path_t, facecolor="none", edgecolor=edge_color,
                           lw=gost_line_width, clip_on=True,
                           transform=ax.transData, zorder=10)
         ax.add_patch(patch)
-        cursor_x += w_mm
-        if i < len(parts) - 1:
-            cursor_x += spacing_corr
 
-def draw_word_dots(ax, text, center_x, y, scale, fontprops, spacing_mm, cap_height_mm, dot_color):
-    if not text.strip():
+def draw_dots(ax, lines, cap_height_mm, dot_color):
+    """
+    Точки в начале слов всех строк одной коллекцией: одна отрисовка
+    вместо Circle-патча на каждое слово. Нужны только метрики слов.
+    """
+    centers = [(cursor_x + x_offset, line.y) for line in lines
+               for x_offset, cursor_x in zip(line.x_offsets, line.word_x)]
+    if not centers:
         return
-    total_w, parts = measure_line_total_width(text, scale, fontprops, spacing_mm)
-    cursor_x = center_x - total_w / 2.0
-    radius = (cap_height_mm / 14.0) / 2.0
-    spacing_corr = spacing_mm * CORRECTION_K
-    for i, (_, w_mm, x_offset) in enumerate(parts):
-        dot_x = cursor_x + x_offset
-        ax.add_patch(Circle((dot_x, y), radius=radius, color=dot_color, zorder=10))
-        cursor_x += w_mm
-        if i < len(parts) - 1:
-            cursor_x += spacing_corr
+    diameter = cap_height_mm / 14.0
+    ax.add_collection(EllipseCollection(diameter, diameter, 0.0, units="xy",
+                                        offsets=centers, offset_transform=ax.transData,
+                                        facecolors=dot_color, edgecolors=dot_color,
+                                        linewidths=DOT_EDGE_WIDTH, zorder=10),
+                      autolim=False)
+
+def draw_line_dots(ax, line, cap_height_mm, dot_color):
+    draw_dots(ax, [line], cap_height_mm, dot_color)
+
+def draw_gost_text(ax, text, center_x, y, scale, fontprops,
+                   spacing_mm=DEFAULT_SPACING, line_width_mm=DEFAULT_LINE_WIDTH,
+                   cap_height_mm=DEFAULT_FONT_SIZE, edge_color=DEFAULT_FONT_COLOR):
+    line = layout_line(text, center_x, y, scale, fontprops, spacing_mm, cap_height_mm)
+    draw_line_text(ax, line, line_width_mm, cap_height_mm, edge_color)
+
+def draw_word_dots(ax, text, center_x, y, scale, fontprops, spacing_mm, cap_height_mm, dot_color):
+    line = layout_line(text, center_x, y, scale, fontprops, spacing_mm, cap_height_mm)
+    draw_line_dots(ax, line, cap_height_mm, dot_color)
 
 # ------------------ Класс TextRenderer ------------------
 class TextRenderer:
@@ -174,6 +633,30 @@ class TextRenderer:
         self.padding = padding
         self.scale = get_text_scale(font_size, self.font)
 
+    # -----------------------------------------------------
+    def layout(self, lines, base_y=None):
+        """
+        Этап раскладки: замеряет строки один раз. Результат можно
+        перерисовывать с другими цветами и флагами без повторного замера.
+        base_y — первая базовая линия (для страниц из paginate()).
+        """
+        with metrics.stage("layout"):
+            return layout_page(lines, self.scale, self.font, self.spacing,
+                               self.font_size, padding=self.padding, base_y=base_y)
+
+    def paginate(self, lines):
+        """
+        Разбивка строк по страницам без замера: пары (base_y, строки).
+        """
+        return paginate(lines, self.font_size, padding=self.padding)
+
+    def layout_pages(self, lines):
+        """
+        Постраничная раскладка длинного текста (генератор PageLayout).
+        """
+        return layout_pages(lines, self.scale, self.font, self.spacing,
+                            self.font_size, padding=self.padding)
+
     # -----------------------------------------------------
     def render_to_figure(self, lines,
                          show_grid=True,
@@ -181,59 +664,99 @@ class TextRenderer:
                          dots_only=False,
                          classic_grid=False,
                          thin_step_h=DEFAULT_THIN_STEP,
-                         thin_step_v=DEFAULT_THIN_STEP):
+                         thin_step_v=DEFAULT_THIN_STEP,
+                         grid_mode=DEFAULT_GRID_MODE,
+                         return_layout=False):
         """
         Основная функция: создаёт страницу, сетку и текст.
+        В режимах "только точки" и "без букв" раскладка обходится метриками
+        слов: контуры букв не строятся, точки рисуются одной коллекцией.
+        При return_layout=True возвращает (fig, layout).
+        Фигура принадлежит вызывающему: после сохранения её нужно
+        отдать в figure_bytes() или release_figure().
+        """
+        layout = self.layout(lines)
+        fig = self.render_layout(layout,
+                                 show_grid=show_grid,
+                                 show_font=show_font,
+                                 dots_only=dots_only,
+                                 classic_grid=classic_grid,
+                                 thin_step_h=thin_step_h,
+                                 thin_step_v=thin_step_v,
+                                 grid_mode=grid_mode)
+        return (fig, layout) if return_layout else fig
+
+    # -----------------------------------------------------
+    def render_layout(self, layout,
+                      show_grid=True,
+                      show_font=True,
+                      dots_only=False,
+                      classic_grid=False,
+                      thin_step_h=DEFAULT_THIN_STEP,
+                      thin_step_v=DEFAULT_THIN_STEP,
+                      grid_mode=DEFAULT_GRID_MODE,
+                      frame_color=None,
+                      grid_color=None,
+                      font_color=None):
         """
+        Отрисовывает готовую раскладку. Цвета по умолчанию — из настроек отрисовщика.
+        """
+        frame_color = self.frame_color if frame_color is None else frame_color
+        grid_color = self.grid_color if grid_color is None else grid_color
+        font_color = self.font_color if font_color is None else font_color
+
         # Создаём страницу под ГОСТ
-        fig = plt.figure(figsize=mm_figsize(DEFAULT_PAGE_W, DEFAULT_PAGE_H), dpi=self.dpi)
+        fig = new_figure(layout.page_w, layout.page_h, dpi=self.dpi)
         ax = fig.add_axes([0, 0, 1, 1])
-        ax.set_xlim(0, DEFAULT_PAGE_W)
-        ax.set_ylim(0, DEFAULT_PAGE_H)
+        ax.set_xlim(0, layout.page_w)
+        ax.set_ylim(0, layout.page_h)
         ax.set_aspect('equal', adjustable='box')
         ax.axis("off")
 
         # Рамка
-        frame_rect, x0, y0, x1, y1 = draw_frame(ax, DEFAULT_PAGE_W, DEFAULT_PAGE_H, self.frame_color)
-
-        # Координаты начала текста
-        center_x = (x0 + x1) / 2.0
-        start_y = y0 + (y1 - y0) * 0.65
-        base_y = start_y - (start_y % DEFAULT_LINE_STEP)
-
-        # Расчёт "боксов" для сетки
-        boxes = compute_text_boxes(lines, center_x, base_y,
-                                   DEFAULT_LINE_STEP, self.scale, self.font,
-                                   self.spacing, self.font_size, padding=self.padding)
+        frame_rect, x0, y0, x1, y1 = draw_frame(ax, layout.page_w, layout.page_h, frame_color)
 
         # Отрисовка сетки (если включена)
         if show_grid and not dots_only:
-            draw_grid_in_boxes(ax, boxes, frame_rect, x0, y0, x1, y1,
-                               thin_step_h=thin_step_h,
-                               thin_step_v=thin_step_v,
-                               angle=DEFAULT_ANGLE,
-                               color=self.grid_color,
-                               classic=classic_grid)
-
-        # Отрисовка строк
-        y = base_y
-        for line in lines:
-            # Если показываем только точки или выключен текст
-            if dots_only or (not show_font):
-                draw_word_dots(ax, line, center_x, y, self.scale, self.font,
-                               spacing_mm=self.spacing,
-                               cap_height_mm=self.font_size,
-                               dot_color=self.font_color)
-            # Если показываем буквы
-            if show_font and not dots_only:
-                draw_gost_text(ax, line, center_x, y, self.scale, self.font,
-                               spacing_mm=self.spacing,
-                               cap_height_mm=self.font_size,
-                               line_width_mm=self.line_width,   # ✅ теперь используется переданная толщина
-                               edge_color=self.font_color)
-            y -= DEFAULT_LINE_STEP
+            with metrics.stage("grid"):
+                draw_grid_in_boxes(ax, layout.boxes, frame_rect, x0, y0, x1, y1,
+                                   thin_step_h=thin_step_h,
+                                   thin_step_v=thin_step_v,
+                                   angle=DEFAULT_ANGLE,
+                                   color=grid_color,
+                                   classic=classic_grid,
+                                   mode=grid_mode)
+
+        # Если показываем только точки или выключен текст — хватает метрик слов,
+        # контуры букв не строятся
+        if dots_only or (not show_font):
+            with metrics.stage("dots"):
+                draw_dots(ax, layout.lines, layout.cap_height_mm, dot_color=font_color)
+
+        # Если показываем буквы
+        if show_font and not dots_only:
+            with metrics.stage("glyphs"):
+                for line in layout.lines:
+                    draw_line_text(ax, line,
+                                   cap_height_mm=layout.cap_height_mm,
+                                   line_width_mm=self.line_width,   # ✅ теперь используется переданная толщина
+                                   edge_color=font_color)
 
         return fig
+
+# ------------------ Прогрев шрифтов ------------------
+def prewarm_fonts(font_paths, font_size=DEFAULT_FONT_SIZE, sample=PREWARM_TEXT):
+    """
+    Прогрев шрифтов при старте процесса: FontProperties, FT2Font, масштаб
+    и контуры образца попадают в кэши. Возвращает {путь: TextRenderer}.
+    """
+    renderers = {}
+    for path in font_paths:
+        renderer = TextRenderer(path, font_size=font_size)
+        renderer.layout([sample])
+        renderers[path] = renderer
+    return renderers
+
 # =====================================================================
 # ✏️  РЕЖИМ ОБУЧЕНИЯ — АНИМАЦИЯ РЕАЛЬНЫХ СИМВОЛОВ ГОСТ-ШРИФТА
 # ---------------------------------------------------------------------
@@ -241,14 +764,6 @@ class TextRenderer:
 # процесс написания (постепенное проявление линий).
 # =====================================================================
 
-from matplotlib.textpath import TextPath
-from matplotlib.animation import FuncAnimation, PillowWriter
-from matplotlib.font_manager import FontProperties
-import matplotlib.pyplot as plt
-import numpy as np
-from PIL import Image
-import os
-
 def render_training_letter_images(
     text_lines,
     image_dir="letter_images",
@@ -259,68 +774,15 @@ def render_training_letter_images(
     """
     Создаёт gif-анимацию из изображений букв.
     Каждая буква отображается по очереди — согласно введённому тексту.
+    Формат (GIF, WebP, APNG) выбирается по расширению save_path.
     """
+    from training_animation import save_animation
 
     print("🎞 Создание gif-анимации из изображений букв...")
 
-    frames = []
-    for line in text_lines:
-        for ch in line:
-            if ch.isspace():
-                continue
-            suffix = ".upper" if ch.isupper() else ".lower"
-            filename = f"{ch}{suffix}.png"
-            path = os.path.join(image_dir, filename)
-
-            if not os.path.exists(path):
-                print(f"⚠️ Нет изображения для буквы: {ch} → {filename}")
-                continue
-
-            img = Image.open(path).convert("RGBA")
-            if img.size != canvas_size:
-                img = img.resize(canvas_size)
-
-            frames.append(img)
-
-    if not frames:
+    if not save_animation(text_lines, save_path, image_dir=image_dir,
+                          canvas_size=tuple(canvas_size), frame_duration=frame_duration):
         print("⚠️ Нет доступных букв для создания анимации.")
         return
 
-    frames[0].save(
-        save_path,
-        save_all=True,
-        append_images=frames[1:],
-        duration=int(frame_duration * 5000), # — это длительность одного кадра в миллисекундах
-        loop=0
-    )
-
     print(f"✅ GIF сохранён: {save_path}")
-
-
-
-    points = np.array(points)
-    total_frames = len(points)
-
-    # --- Инициализация анимации ---
-    def init():
-        drawn_line.set_data([], [])
-        return drawn_line,
-
-    # --- Обновление: постепенная прорисовка контуров ---
-    def update(frame):
-        drawn_line.set_data(points[:frame, 0], points[:frame, 1])
-        return drawn_line,
-
-    ani = FuncAnimation(
-        fig,
-        update,
-        frames=total_frames,
-        init_func=init,
-        interval=frame_interval,
-        blit=True,
-        repeat=False
-    )
-
-    ani.save(save_path, writer=PillowWriter(fps=30))
-    plt.close(fig)
-    print(f"✅ Анимация написания символов сохранена: {save_path}")
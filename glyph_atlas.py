@@ -0,0 +1,316 @@
+# glyph_atlas.py — предкомпилированный атлас глифов шрифта
+#  Контуры, продвижения, габариты и кернинг набора символов в массивах NumPy.
+#  Атлас лежит рядом с .ttf (GOST.ttf -> GOST.atlas/) и отображается в память
+#  каждым воркером: контур слова собирается склейкой массивов, без разбора шрифта.
+#
+#  Сборка атласов для всех шрифтов папки fonts/:
+#      python glyph_atlas.py
+
+import json
+import os
+import shutil
+import sys
+import tempfile
+import threading
+import numpy as np
+from matplotlib.font_manager import get_font
+from matplotlib.ft2font import KERNING_DEFAULT, LOAD_NO_HINTING
+from matplotlib.path import Path
+
+# ------------------ Константы ------------------
+ATLAS_VERSION = 1
+ATLAS_SUFFIX = ".atlas"
+META_FILE = "meta.json"
+FONT_SCALE = 100.0      # размер, в котором TextPath строит контуры (pt при 72 dpi)
+FONT_DPI = 72
+ARRAYS = ("codepoints", "glyph_index", "advance", "bbox", "offsets",
+          "vertices", "codes", "kern_left", "kern_right", "kern_value")
+
+# Набор символов: печатная латиница с цифрами и знаками, кириллица, типографские знаки
+CHARSET = ("".join(chr(c) for c in range(0x20, 0x7F))
+           + "".join(chr(c) for c in range(0x400, 0x460))
+           + "«»„“”‘’–—…№°×")
+
+# ------------------ Векторные суммы ------------------
+def segment_cumsum(values, lengths):
+    """
+    Накопленные суммы внутри подряд идущих отрезков массива values.
+    Отрезки одной длины суммируются одной матрицей по строкам, поэтому
+    порядок сложений тот же, что у цикла "x += v" (и результат бит в бит).
+    """
+    values = np.asarray(values, np.float64)
+    lengths = np.asarray(lengths, np.int64)
+    out = np.empty_like(values)
+    starts = np.cumsum(lengths) - lengths
+    for length in np.unique(lengths):
+        if length == 0:
+            continue
+        idx = starts[lengths == length][:, None] + np.arange(length)
+        out[idx] = np.cumsum(values[idx], axis=1)
+    return out
+
+# ------------------ Сборка ------------------
+def atlas_dir(font_path):
+    return os.path.splitext(font_path)[0] + ATLAS_SUFFIX
+
+def _font_signature(font_path):
+    st = os.stat(font_path)
+    return {"version": ATLAS_VERSION, "font_size": st.st_size, "font_mtime": int(st.st_mtime)}
+
+def build_atlas(font_path, charset=CHARSET):
+    """
+    Разбирает шрифт один раз и возвращает словарь массивов атласа.
+    Контуры и кернинг — в тех же единицах, что у TextPath(size=100).
+    """
+    font = get_font(font_path)
+    font.set_size(FONT_SCALE, FONT_DPI)
+    codepoints, glyph_index, advance, bbox, offsets = [], [], [], [], [0]
+    vertices, codes = [], []
+    try:
+        for ch in charset:
+            glyph_id = font.get_char_index(ord(ch))
+            glyph = font.load_glyph(glyph_id, flags=LOAD_NO_HINTING)
+            verts, glyph_codes = font.get_path()
+            codepoints.append(ord(ch))
+            glyph_index.append(glyph_id)
+            advance.append(glyph.linearHoriAdvance / 65536)
+            if len(verts):
+                bbox.append((*verts.min(axis=0), *verts.max(axis=0)))
+            else:
+                bbox.append((0.0, 0.0, 0.0, 0.0))
+            vertices.append(np.asarray(verts, np.float64).reshape(-1, 2))
+            codes.append(np.asarray(glyph_codes, np.uint8))
+            offsets.append(offsets[-1] + len(verts))
+
+        # Кернинг хранится разреженно: только ненулевые пары
+        kern_left, kern_right, kern_value = [], [], []
+        for i, left in enumerate(glyph_index):
+            for j, right in enumerate(glyph_index):
+                value = font.get_kerning(left, right, KERNING_DEFAULT)
+                if value:
+                    kern_left.append(i)
+                    kern_right.append(j)
+                    kern_value.append(value / 64)
+    finally:
+        font.clear()
+
+    return {
+        "codepoints": np.array(codepoints, np.int32),
+        "glyph_index": np.array(glyph_index, np.int32),
+        "advance": np.array(advance, np.float64),
+        "bbox": np.array(bbox, np.float64).reshape(-1, 4),
+        "offsets": np.array(offsets, np.int64),
+        "vertices": np.concatenate(vertices) if vertices else np.empty((0, 2)),
+        "codes": np.concatenate(codes) if codes else np.empty(0, np.uint8),
+        "kern_left": np.array(kern_left, np.int32),
+        "kern_right": np.array(kern_right, np.int32),
+        "kern_value": np.array(kern_value, np.float64),
+    }
+
+def save_atlas(font_path, arrays):
+    """
+    Пишет атлас в каталог рядом со шрифтом. Каталог собирается во временном
+    месте и подменяется целиком, поэтому воркеры не увидят его наполовину.
+    """
+    target = atlas_dir(font_path)
+    tmp = tempfile.mkdtemp(dir=os.path.dirname(target), prefix=".atlas-")
+    try:
+        for name in ARRAYS:
+            np.save(os.path.join(tmp, name + ".npy"), arrays[name])
+        with open(os.path.join(tmp, META_FILE), "w", encoding="utf-8") as fh:
+            json.dump(_font_signature(font_path), fh)
+        if os.path.isdir(target):
+            shutil.rmtree(target, ignore_errors=True)
+        os.replace(tmp, target)
+    except OSError:
+        shutil.rmtree(tmp, ignore_errors=True)
+        if not os.path.isdir(target):
+            raise
+    return target
+
+# ------------------ Атлас в памяти ------------------
+class GlyphAtlas:
+    """
+    Атлас одного шрифта. Массивы отображены в память (np.load с mmap_mode),
+    поэтому страницы атласа общие для всех процессов.
+    """
+
+    def __init__(self, arrays):
+        for name in ARRAYS:
+            setattr(self, name, arrays[name])
+        self.char_index = {chr(cp): i for i, cp in enumerate(self.codepoints.tolist())}
+        self.kerning = {(left, right): value for left, right, value in
+                        zip(self.kern_left.tolist(), self.kern_right.tolist(),
+                            self.kern_value.tolist())}
+        # Для векторных замеров: таблица код символа -> номер в атласе (-1 — нет),
+        # отсортированные ключи пар кернинга и признак непустого контура
+        self._lookup = np.full(int(self.codepoints.max()) + 1, -1, np.int64)
+        self._lookup[self.codepoints] = np.arange(len(self.codepoints))
+        n = len(self.codepoints)
+        keys = self.kern_left.astype(np.int64) * n + self.kern_right
+        order = np.argsort(keys)
+        self._kern_keys = keys[order]
+        self._kern_values = np.asarray(self.kern_value)[order]
+        self._outlined = np.diff(self.offsets) > 0
+
+    @classmethod
+    def load(cls, font_path):
+        """
+        Отображает атлас в память; None — если его нет или он устарел.
+        """
+        folder = atlas_dir(font_path)
+        try:
+            with open(os.path.join(folder, META_FILE), encoding="utf-8") as fh:
+                if json.load(fh) != _font_signature(font_path):
+                    return None
+            arrays = {name: np.load(os.path.join(folder, name + ".npy"), mmap_mode="r")
+                      for name in ARRAYS}
+        except (OSError, ValueError):
+            return None
+        return cls(arrays)
+
+    def indices(self, text):
+        """
+        Номера символов текста в атласе; None — если какого-то символа нет.
+        """
+        try:
+            return [self.char_index[ch] for ch in text]
+        except KeyError:
+            return None
+
+    def positions(self, indices):
+        """
+        Левые края символов строки (продвижения плюс кернинг), как у TextPath.
+        """
+        xs, x, prev = [], 0.0, None
+        for i in indices:
+            if prev is not None:
+                x += self.kerning.get((prev, i), 0.0)
+            xs.append(x)
+            x += self.advance[i]
+            prev = i
+        return xs
+
+    def word_bounds(self, words):
+        """
+        Левые и правые края контуров слов (ед. TextPath size=100) одним
+        векторным проходом по всем символам. Совпадают с min/max вершин
+        TextPath слова; NaN — для слов, которые атлас не покрывает.
+        """
+        xmin = np.full(len(words), np.nan)
+        xmax = np.full(len(words), np.nan)
+        if not words:
+            return xmin, xmax
+        lengths = np.array([len(w) for w in words], np.int64)
+        codes = np.frombuffer("".join(words).encode("utf-32-le"), np.uint32).astype(np.int64)
+        glyphs = np.where(codes < len(self._lookup),
+                          self._lookup[np.minimum(codes, len(self._lookup) - 1)], -1)
+        word_of = np.repeat(np.arange(len(words)), lengths)
+        starts = np.cumsum(lengths) - lengths
+        valid = np.ones(len(words), bool)
+        np.logical_and.at(valid, word_of, glyphs >= 0)
+        valid &= np.array(["$" not in w for w in words])
+        g = np.where(glyphs >= 0, glyphs, 0)
+
+        # Позиции символов: продвижение предыдущего, затем кернинг пары —
+        # в том же порядке сложений, что и в positions()
+        first = np.zeros(len(g), bool)
+        first[starts[lengths > 0]] = True
+        kern = np.zeros(len(g))
+        if len(self._kern_keys):
+            pair = g[:-1] * len(self.codepoints) + g[1:]
+            pos = np.minimum(np.searchsorted(self._kern_keys, pair), len(self._kern_keys) - 1)
+            kern[1:] = np.where(self._kern_keys[pos] == pair, self._kern_values[pos], 0.0)
+        steps = np.empty(2 * len(g))
+        steps[0::2] = np.where(first, 0.0, kern)
+        steps[1::2] = self.advance[g]
+        steps = np.delete(steps, 2 * np.flatnonzero(first))   # у первого символа нет кернинга
+        sums = segment_cumsum(steps, np.maximum(2 * lengths - 1, 0))
+        # Символ c слова w (не первый) стоит после суммы с индексом 2c - w - 1
+        x = np.zeros(len(g))
+        rest = np.flatnonzero(~first)
+        x[rest] = sums[2 * rest - word_of[rest] - 1]
+
+        outlined = self._outlined[g] & (glyphs >= 0)
+        left = np.where(outlined, x + self.bbox[g, 0], np.inf)
+        right = np.where(outlined, x + self.bbox[g, 2], -np.inf)
+        valid &= np.bincount(word_of, outlined, len(words)) > 0
+        lo = np.full(len(words), np.inf)
+        hi = np.full(len(words), -np.inf)
+        np.minimum.at(lo, word_of, left)
+        np.maximum.at(hi, word_of, right)
+        xmin[valid] = lo[valid]
+        xmax[valid] = hi[valid]
+        return xmin, xmax
+
+    def text_path(self, text):
+        """
+        Контур текста размера 100 pt — те же вершины и коды, что у
+        TextPath((0, 0), text, size=100). None — если символа нет в атласе
+        или текст был бы разобран как формула ($...$).
+        """
+        if "$" in text:
+            return None
+        indices = self.indices(text)
+        if indices is None:
+            return None
+        offsets = self.offsets
+        verts, codes = [], []
+        for i, x in zip(indices, self.positions(indices)):
+            start, stop = offsets[i], offsets[i + 1]
+            if stop > start:
+                verts.append(self.vertices[start:stop] + (x, 0.0))
+                codes.append(self.codes[start:stop])
+        if not verts:
+            return Path(np.empty((0, 2)), np.empty(0, np.uint8))
+        return Path(np.concatenate(verts), np.concatenate(codes))
+
+# ------------------ Реестр атласов ------------------
+_atlases = {}
+_atlases_lock = threading.Lock()
+
+def get_atlas(font_path, build=True):
+    """
+    Атлас шрифта из реестра процесса. При первом обращении он
+    отображается в память с диска, а если его нет — собирается и сохраняется.
+    None — если атлас недоступен (тогда контуры строит TextPath).
+    """
+    key = os.path.realpath(font_path)
+    atlas = _atlases.get(key)
+    if atlas is not None or key in _atlases:
+        return atlas
+    with _atlases_lock:
+        if key in _atlases:
+            return _atlases[key]
+        atlas = GlyphAtlas.load(key)
+        if atlas is None and build and os.path.isfile(key):
+            try:
+                save_atlas(key, build_atlas(key))
+                atlas = GlyphAtlas.load(key)
+            except OSError as e:
+                print(f"⚠️ Атлас глифов не сохранён ({os.path.basename(key)}): {e}")
+                atlas = GlyphAtlas(build_atlas(key))
+        _atlases[key] = atlas
+        return atlas
+
+def preload_atlases(font_paths):
+    """
+    Загружает атласы шрифтов при старте процесса (до fork воркеров gunicorn).
+    """
+    return {path: get_atlas(path) for path in font_paths}
+
+# ------------------ Командная строка ------------------
+def main():
+    fonts_dir = sys.argv[1] if len(sys.argv) > 1 else os.path.join(
+        os.path.dirname(os.path.abspath(__file__)), "fonts")
+    for name in sorted(os.listdir(fonts_dir)):
+        if not name.lower().endswith((".ttf", ".otf")):
+            continue
+        font_path = os.path.join(fonts_dir, name)
+        arrays = build_atlas(font_path)
+        target = save_atlas(font_path, arrays)
+        size = sum(a.nbytes for a in arrays.values())
+        print(f"✅ {name}: {len(arrays['codepoints'])} символов, {size / 1024:.0f} КБ -> {target}")
+
+if __name__ == "__main__":
+    main()
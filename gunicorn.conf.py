@@ -0,0 +1,28 @@
+# gunicorn.conf.py — запуск веб-воркеров
+#  Приложение загружается в мастере (атласы, шрифты, кодеки) и наследуется воркерами при fork
+
+import gc
+import os
+
+# Импорт и прогрев app — один раз в мастере, а не в каждом воркере
+preload_app = True
+
+# Число воркеров: то же значение app.py делит между ними пул процессов рендера
+workers = int(os.environ.get("WEB_CONCURRENCY", "1"))
+
+# Синхронный воркер, занятый дольше timeout, убивается мастером: ожидание заданий
+# в запросах (JOB_WAIT_LIMIT в app.py) держится намного меньше этого значения, а долгий
+# рендер (многостраничные документы, gif) идёт заданием в пуле процессов, вне запроса
+timeout = int(os.environ.get("GUNICORN_TIMEOUT", "30"))
+
+# Сборщик мусора в мастере выключен до fork: он не перекладывает объекты
+# и не дырявит страницы, которые воркеры делят copy-on-write
+gc.disable()
+
+def pre_fork(server, worker):
+    # Всё, что создано при загрузке, — в постоянное поколение: сборщик
+    # воркера не обходит эти объекты и не копирует их страницы
+    gc.freeze()
+
+def post_fork(server, worker):
+    gc.enable()
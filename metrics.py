@@ -0,0 +1,189 @@
+# metrics.py — таймеры этапов рендера и счётчики процесса в формате Prometheus
+#  Без внешних зависимостей: этап — это with stage("pdf"), а не профилировщик
+
+import os
+import threading
+import time
+from bisect import bisect_left
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+# ------------------ Константы ------------------
+PREFIX = "lettertrainer_"
+STAGE_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+# Метрика -> (тип, описание)
+METRICS = {
+    "stage_seconds": ("histogram", "Длительность этапа рендера"),
+    "request_seconds": ("histogram", "Длительность обработки запроса"),
+    "requests_total": ("counter", "Обработанные запросы"),
+    "artists_created_total": ("counter", "Примитивы страницы (отрезки сетки, контуры букв, точки) по этапам"),
+    "bytes_written_total": ("counter", "Байты готовых файлов по форматам"),
+}
+
+_lock = threading.Lock()
+_counters = {}      # (метрика, метки) -> значение
+_histograms = {}    # (метрика, метки) -> [счётчики корзин..., сумма, количество]
+
+# Этапы текущего запроса: имя -> суммарная длительность; None — запрос не отслеживается
+_request_timings = ContextVar("request_timings", default=None)
+
+# ------------------ Запись ------------------
+def _labels(labels):
+    return tuple(sorted(labels.items()))
+
+def inc(name, value=1, **labels):
+    key = (name, _labels(labels))
+    with _lock:
+        _counters[key] = _counters.get(key, 0) + value
+
+def observe(name, seconds, **labels):
+    key = (name, _labels(labels))
+    index = bisect_left(STAGE_BUCKETS, seconds)
+    with _lock:
+        row = _histograms.get(key)
+        if row is None:
+            row = _histograms[key] = [0] * len(STAGE_BUCKETS) + [0.0, 0]
+        if index < len(STAGE_BUCKETS):
+            row[index] += 1
+        row[-2] += seconds
+        row[-1] += 1
+
+@contextmanager
+def stage(name):
+    """
+    Замер этапа: в гистограмму процесса и в Server-Timing текущего запроса.
+    """
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        elapsed = time.perf_counter() - started
+        observe("stage_seconds", elapsed, stage=name)
+        timings = _request_timings.get()
+        if timings is not None:
+            timings[name] = timings.get(name, 0.0) + elapsed
+
+def reset():
+    """
+    Обнуляет счётчики процесса, например после прогрева при старте.
+    """
+    with _lock:
+        _counters.clear()
+        _histograms.clear()
+
+def collect():
+    """
+    Снимок счётчиков и гистограмм процесса: процесс пула возвращает его
+    вместе с результатом задания, веб-воркер добавляет к своим через merge().
+    """
+    with _lock:
+        return {"counters": dict(_counters),
+                "histograms": {key: list(row) for key, row in _histograms.items()}}
+
+def merge(snapshot):
+    with _lock:
+        for key, value in snapshot["counters"].items():
+            _counters[key] = _counters.get(key, 0) + value
+        for key, row in snapshot["histograms"].items():
+            mine = _histograms.get(key)
+            if mine is None:
+                _histograms[key] = list(row)
+            else:
+                for i, value in enumerate(row):
+                    mine[i] += value
+
+# ------------------ Запрос ------------------
+def begin_request():
+    _request_timings.set({})
+
+def end_request():
+    """
+    Этапы текущего запроса {имя: секунды}; отслеживание запроса заканчивается.
+    """
+    timings = _request_timings.get() or {}
+    _request_timings.set(None)
+    return timings
+
+def server_timing(timings, total=None):
+    """
+    Значение заголовка Server-Timing: длительности в миллисекундах.
+    """
+    parts = [f"{name};dur={seconds * 1000:.1f}" for name, seconds in timings.items()]
+    if total is not None:
+        parts.append(f"total;dur={total * 1000:.1f}")
+    return ", ".join(parts)
+
+# ------------------ Экспорт ------------------
+def _format_labels(labels):
+    if not labels:
+        return ""
+    body = ",".join('%s="%s"' % (k, str(v).replace("\\", "\\\\").replace('"', '\\"'))
+                    for k, v in labels)
+    return "{" + body + "}"
+
+def _header(lines, name, kind, help_text):
+    lines.append(f"# HELP {PREFIX}{name} {help_text}")
+    lines.append(f"# TYPE {PREFIX}{name} {kind}")
+
+def cache_samples(caches):
+    """
+    Семплы счётчиков LRU-кэшей: caches — словарь {имя: stats()}.
+    """
+    samples = {"cache_hits_total": [], "cache_misses_total": [],
+               "cache_evictions_total": [], "cache_entries": []}
+    for cache, stats in caches.items():
+        labels = (("cache", cache),)
+        samples["cache_hits_total"].append((labels, stats["hits"]))
+        samples["cache_misses_total"].append((labels, stats["misses"]))
+        samples["cache_evictions_total"].append((labels, stats["evictions"]))
+        samples["cache_entries"].append((labels, stats["size"]))
+    return [("cache_hits_total", "counter", "Попадания в кэш", samples["cache_hits_total"]),
+            ("cache_misses_total", "counter", "Промахи кэша", samples["cache_misses_total"]),
+            ("cache_evictions_total", "counter", "Вытеснения из кэша",
+             samples["cache_evictions_total"]),
+            ("cache_entries", "gauge", "Записей в кэше", samples["cache_entries"])]
+
+def render_prometheus(extra=()):
+    """
+    Текст метрик процесса в формате Prometheus. extra — дополнительные
+    семейства [(имя, тип, описание, [(метки, значение), ...]), ...].
+    Метки процесса (pid) различают воркеры gunicorn.
+    """
+    pid = (("pid", str(os.getpid())),)
+    with _lock:
+        counters = dict(_counters)
+        histograms = {key: list(row) for key, row in _histograms.items()}
+
+    lines = []
+    for name, (kind, help_text) in METRICS.items():
+        if kind == "counter":
+            rows = [(labels, value) for (metric, labels), value in counters.items()
+                    if metric == name]
+            if not rows:
+                continue
+            _header(lines, name, kind, help_text)
+            for labels, value in sorted(rows):
+                lines.append(f"{PREFIX}{name}{_format_labels(pid + labels)} {value}")
+            continue
+        rows = [(labels, row) for (metric, labels), row in histograms.items() if metric == name]
+        if not rows:
+            continue
+        _header(lines, name, kind, help_text)
+        for labels, row in sorted(rows):
+            cumulative = 0
+            for bound, count in zip(STAGE_BUCKETS, row):
+                cumulative += count
+                le = pid + labels + (("le", repr(bound)),)
+                lines.append(f"{PREFIX}{name}_bucket{_format_labels(le)} {cumulative}")
+            le = pid + labels + (("le", "+Inf"),)
+            lines.append(f"{PREFIX}{name}_bucket{_format_labels(le)} {row[-1]}")
+            lines.append(f"{PREFIX}{name}_sum{_format_labels(pid + labels)} {row[-2]:.6f}")
+            lines.append(f"{PREFIX}{name}_count{_format_labels(pid + labels)} {row[-1]}")
+
+    for name, kind, help_text, samples in extra:
+        _header(lines, name, kind, help_text)
+        for labels, value in samples:
+            lines.append(f"{PREFIX}{name}{_format_labels(pid + tuple(labels))} {value}")
+    return "\n".join(lines) + "\n"
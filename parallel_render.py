@@ -0,0 +1,100 @@
+# parallel_render.py — многостраничные листы на пуле процессов
+#  Страницы режутся на диапазоны, диапазоны рендерятся параллельно и склеиваются по порядку
+
+import math
+import os
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from itertools import islice
+
+from font_on_temp5_to_gost import TextRenderer, paginate
+from pdf_renderer import write_pdf, page_spec, image_page_spec, _page_options
+from raster_renderer import render_png
+from render_service import PNG_DPI, RENDERER_KEYS, render_flags
+
+# ------------------ Константы ------------------
+PAGE_FORMATS = ("pdf", "png")
+RANGES_PER_WORKER = 4     # диапазонов на процесс: короткие диапазоны лучше балансируются
+MAX_RANGE_PAGES = 4       # страниц в диапазоне: PNG-страница 300 dpi — около 1.2 МБ
+WINDOW_PER_WORKER = 2     # диапазонов в работе на процесс пула
+
+# Отрисовщик процесса пула: FontProperties и масштаб загружаются один раз
+_worker_renderer = None
+
+# ------------------ Функции, выполняемые в процессах пула ------------------
+def _init_worker(renderer_kwargs):
+    global _worker_renderer
+    _worker_renderer = TextRenderer(**renderer_kwargs)
+
+def _render_range(pages, fmt, flags):
+    return render_pages(_worker_renderer, pages, fmt, flags)
+
+# ------------------ Рендер документа ------------------
+def render_pages(renderer, pages, fmt, flags):
+    """
+    Рендерит диапазон страниц [(base_y, строки), ...] и возвращает
+    описания страниц для write_pdf() в том же порядке.
+    """
+    specs = []
+    for base_y, lines in pages:
+        layout = renderer.layout(lines, base_y=base_y)
+        if fmt == "pdf":
+            specs.append(page_spec(layout, _page_options(renderer, flags)))
+        else:
+            png = render_png(renderer, layout, dpi=PNG_DPI, **flags)
+            specs.append(image_page_spec(png, layout.page_w, layout.page_h))
+    return specs
+
+def page_ranges(pages, workers):
+    """
+    Режет список страниц на непрерывные диапазоны для пула.
+    """
+    size = min(max(1, math.ceil(len(pages) / (workers * RANGES_PER_WORKER))), MAX_RANGE_PAGES)
+    return [pages[i:i + size] for i in range(0, len(pages), size)]
+
+def ordered_results(pool, ranges, fmt, flags, window):
+    """
+    Описания страниц строго по порядку диапазонов. В работе не больше window
+    диапазонов: следующий ставится, когда отдан головной, поэтому готовые
+    страницы не копятся в памяти, пока клиент медленно читает ответ.
+    """
+    ranges = iter(ranges)
+    pending = deque(pool.submit(_render_range, pages, fmt, flags)
+                    for pages in islice(ranges, window))
+    try:
+        while pending:
+            specs = pending.popleft().result()
+            for pages in islice(ranges, 1):
+                pending.append(pool.submit(_render_range, pages, fmt, flags))
+            yield from specs
+    finally:
+        # Клиент оборвал загрузку — не рендерим остаток окна
+        for future in pending:
+            future.cancel()
+
+def render_document(params, fmt="pdf", workers=None):
+    """
+    Генератор байтов многостраничного PDF по параметрам рендера.
+    fmt="pdf" — векторные страницы, fmt="png" — растровые страницы PNG_DPI,
+    встроенные в PDF. Диапазоны страниц рендерятся в пуле процессов
+    окном из WINDOW_PER_WORKER диапазонов на процесс, а результаты
+    склеиваются строго по порядку страниц. workers=1 — без пула, в текущем
+    процессе (так документ строит задание, уже выполняемое в пуле JobQueue).
+    """
+    if fmt not in PAGE_FORMATS:
+        raise ValueError(f"Неизвестный формат страниц: {fmt}")
+    renderer_kwargs = {k: params[k] for k in RENDERER_KEYS}
+    flags = render_flags(params)
+    pages = list(paginate(params["lines"], params["font_size"]))
+    workers = min(workers or os.cpu_count() or 1, len(pages))
+    ranges = page_ranges(pages, workers)
+
+    if workers <= 1:
+        renderer = TextRenderer(**renderer_kwargs)
+        yield from write_pdf(spec for pages in ranges
+                             for spec in render_pages(renderer, pages, fmt, flags))
+        return
+    with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker,
+                             initargs=(renderer_kwargs,)) as pool:
+        yield from write_pdf(ordered_results(pool, ranges, fmt, flags,
+                                             workers * WINDOW_PER_WORKER))
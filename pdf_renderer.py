@@ -0,0 +1,293 @@
+# pdf_renderer.py — PDF напрямую через reportlab, без matplotlib-фигуры
+#  Рамка, сетка и контуры букв рисуются по той же раскладке, что считает TextRenderer
+#  Длинные тексты — потоковым многостраничным PDF без накопления страниц в памяти
+
+import io
+import struct
+import zlib
+import numpy as np
+from matplotlib.colors import to_rgb
+from matplotlib.path import Path
+from reportlab.pdfgen import canvas as pdf_canvas
+
+import metrics
+
+from font_on_temp5_to_gost import (
+    MM_INCH, DEFAULT_ANGLE, DEFAULT_THIN_STEP, GRID_LINE_WIDTH, FRAME_LINE_WIDTH,
+    DOT_EDGE_WIDTH, WORD_CACHE_SIZE, LRUCache, PageLayout,
+    grid_segments, clip_segments_to_box, _font_key,
+)
+
+# ------------------ Константы ------------------
+PT_PER_MM = 72.0 / MM_INCH
+
+# PDF-операторы контуров слов: ключ тот же, что у WORD_CACHE
+PDF_OPS_CACHE = LRUCache(WORD_CACHE_SIZE)
+
+# ------------------ Перевод путей в PDF-операторы ------------------
+def path_operators(path):
+    """
+    Переводит matplotlib Path в PDF-операторы построения контура (в мм).
+    Квадратичные кривые TrueType повышаются до кубических.
+    """
+    verts = path.vertices
+    codes = path.codes
+    if codes is None:
+        codes = np.full(len(verts), Path.LINETO)
+        codes[0] = Path.MOVETO
+    ops = []
+    start = current = None
+    i, n = 0, len(codes)
+    while i < n:
+        code = codes[i]
+        if code == Path.MOVETO:
+            start = current = verts[i]
+            ops.append("%.3f %.3f m" % (current[0], current[1]))
+            i += 1
+        elif code == Path.LINETO:
+            current = verts[i]
+            ops.append("%.3f %.3f l" % (current[0], current[1]))
+            i += 1
+        elif code == Path.CURVE3:
+            ctrl, end = verts[i], verts[i + 1]
+            c1 = current + (ctrl - current) * (2.0 / 3.0)
+            c2 = end + (ctrl - end) * (2.0 / 3.0)
+            ops.append("%.3f %.3f %.3f %.3f %.3f %.3f c"
+                       % (c1[0], c1[1], c2[0], c2[1], end[0], end[1]))
+            current = end
+            i += 2
+        elif code == Path.CURVE4:
+            c1, c2, end = verts[i], verts[i + 1], verts[i + 2]
+            ops.append("%.3f %.3f %.3f %.3f %.3f %.3f c"
+                       % (c1[0], c1[1], c2[0], c2[1], end[0], end[1]))
+            current = end
+            i += 3
+        elif code == Path.CLOSEPOLY:
+            ops.append("h")
+            current = start
+            i += 1
+        else:  # Path.STOP
+            i += 1
+    return "\n".join(ops)
+
+def word_operators(layout, word, path_mm):
+    key = (_font_key(layout.fontprops), layout.scale, word)
+    return PDF_OPS_CACHE.get(key, lambda: path_operators(path_mm))
+
+def grid_operators(layout, thin_step_h, thin_step_v, classic_grid):
+    """
+    Отрезки сетки, уже обрезанные по боксам: клип-путей в PDF нет.
+    """
+    segments = grid_segments(*layout.frame, thin_step_h, thin_step_v,
+                             DEFAULT_ANGLE, classic_grid)
+    visible = [clip_segments_to_box(segments, *box) for box in layout.boxes]
+    if not visible:
+        return ""
+    rows = np.concatenate(visible).reshape(-1, 4)
+    metrics.inc("artists_created_total", len(rows), stage="grid", renderer="pdf")
+    return "\n".join("%.3f %.3f m %.3f %.3f l" % tuple(row) for row in rows)
+
+# ------------------ Содержимое страницы ------------------
+def _color_operator(color, op):
+    return "%.4f %.4f %.4f %s" % (*to_rgb(color), op)
+
+def circle_operators(cx, cy, r):
+    """
+    Окружность четырьмя кубическими дугами, как c.circle() в reportlab.
+    """
+    k = r * 0.5522847498
+    return ("%.3f %.3f m "
+            "%.3f %.3f %.3f %.3f %.3f %.3f c %.3f %.3f %.3f %.3f %.3f %.3f c "
+            "%.3f %.3f %.3f %.3f %.3f %.3f c %.3f %.3f %.3f %.3f %.3f %.3f c h"
+            % (cx + r, cy,
+               cx + r, cy + k, cx + k, cy + r, cx, cy + r,
+               cx - k, cy + r, cx - r, cy + k, cx - r, cy,
+               cx - r, cy - k, cx - k, cy - r, cx, cy - r,
+               cx + k, cy - r, cx + r, cy - k, cx + r, cy))
+
+def page_operators(layout,
+                   line_width=None,
+                   show_grid=True,
+                   show_font=True,
+                   dots_only=False,
+                   classic_grid=False,
+                   thin_step_h=DEFAULT_THIN_STEP,
+                   thin_step_v=DEFAULT_THIN_STEP,
+                   frame_color="black",
+                   grid_color="black",
+                   font_color="black"):
+    """
+    Поток PDF-операторов одной страницы раскладки.
+    Толщины линий — в пунктах, как в matplotlib.
+    """
+    ops = ["q", "%.6f 0 0 %.6f 0 0 cm" % (PT_PER_MM, PT_PER_MM)]   # дальше все координаты в мм
+
+    # Рамка
+    x0, y0, x1, y1 = layout.frame
+    ops.append(_color_operator(frame_color, "RG"))
+    ops.append("%.4f w" % (FRAME_LINE_WIDTH / PT_PER_MM))
+    ops.append("%.3f %.3f %.3f %.3f re S" % (x0, y0, x1 - x0, y1 - y0))
+
+    # Сетка
+    if show_grid and not dots_only:
+        with metrics.stage("grid"):
+            grid = grid_operators(layout, thin_step_h, thin_step_v, classic_grid)
+        if grid:
+            ops.append(_color_operator(grid_color, "RG"))
+            ops.append("%.4f w" % (GRID_LINE_WIDTH / PT_PER_MM))
+            ops.append(grid + "\nS")
+
+    # Точки в начале слов
+    if dots_only or (not show_font):
+        radius = (layout.cap_height_mm / 14.0) / 2.0
+        ops.append(_color_operator(font_color, "rg"))
+        ops.append(_color_operator(font_color, "RG"))
+        ops.append("%.4f w" % (DOT_EDGE_WIDTH / PT_PER_MM))
+        dots = 0
+        for line in layout.lines:
+            for x_offset, cursor_x in zip(line.x_offsets, line.word_x):
+                ops.append(circle_operators(cursor_x + x_offset, line.y, radius) + " B")
+                dots += 1
+        metrics.inc("artists_created_total", dots, stage="dots", renderer="pdf")
+
+    # Контуры букв
+    if show_font and not dots_only:
+        cap_height = layout.cap_height_mm
+        gost_line_width = (cap_height / 14.0) if line_width is None else line_width
+        ops.append(_color_operator(font_color, "RG"))
+        ops.append("%.4f w" % (gost_line_width / PT_PER_MM))
+        with metrics.stage("glyphs"):
+            paths = 0
+            for line in layout.lines:
+                for word, path_mm, cursor_x in zip(line.words, line.paths, line.word_x):
+                    word_ops = word_operators(layout, word, path_mm)
+                    if not word_ops:
+                        continue
+                    ops.append("q 1 0 0 1 %.3f %.3f cm" % (cursor_x, line.y))
+                    ops.append(word_ops + "\nS Q")
+                    paths += 1
+            metrics.inc("artists_created_total", paths, stage="glyphs", renderer="pdf")
+
+    ops.append("Q")
+    return "\n".join(ops)
+
+def _page_options(renderer, options):
+    # Цвета и толщина букв по умолчанию — из настроек TextRenderer
+    options = dict(options)
+    options.setdefault("line_width", renderer.line_width)
+    for name in ("frame_color", "grid_color", "font_color"):
+        if options.get(name) is None:
+            options[name] = getattr(renderer, name)
+    return options
+
+# ------------------ Отрисовка на холсте ------------------
+def draw_layout(c, layout, **options):
+    """
+    Рисует страницу раскладки на текущей странице холста reportlab.
+    """
+    c.addLiteral(page_operators(layout, **options))
+
+def render_pdf(renderer, layouts, **options):
+    """
+    Возвращает байты PDF: по странице на каждую раскладку.
+    Цвета и толщина букв по умолчанию берутся из настроек TextRenderer.
+    """
+    if isinstance(layouts, PageLayout):
+        layouts = [layouts]
+    options = _page_options(renderer, options)
+
+    buf = io.BytesIO()
+    c = pdf_canvas.Canvas(buf, pageCompression=1, invariant=1)
+    for layout in layouts:
+        c.setPageSize((layout.page_w * PT_PER_MM, layout.page_h * PT_PER_MM))
+        draw_layout(c, layout, **options)
+        c.showPage()
+    c.save()
+    return buf.getvalue()
+
+# ------------------ Потоковый многостраничный PDF ------------------
+def page_spec(layout, options):
+    """
+    Описание векторной страницы для write_pdf(): сжатый поток операторов и размер.
+    """
+    content = zlib.compress(page_operators(layout, **options).encode("latin-1"))
+    return content, layout.page_w * PT_PER_MM, layout.page_h * PT_PER_MM, None
+
+def image_page_spec(png_bytes, page_w_mm, page_h_mm):
+    """
+    Описание растровой страницы для write_pdf() из PNG (RGB, 8 бит).
+    Сжатые данные IDAT встраиваются в PDF как есть, без перекодирования:
+    фильтры строк PNG снимает предиктор 15 у FlateDecode.
+    """
+    width, height = struct.unpack(">II", png_bytes[16:24])
+    idat, pos = [], 8
+    while pos < len(png_bytes):
+        length, kind = struct.unpack(">I4s", png_bytes[pos:pos + 8])
+        if kind == b"IDAT":
+            idat.append(png_bytes[pos + 8:pos + 8 + length])
+        pos += length + 12
+    page_w, page_h = page_w_mm * PT_PER_MM, page_h_mm * PT_PER_MM
+    content = zlib.compress(b"q %.4f 0 0 %.4f 0 0 cm /Im0 Do Q" % (page_w, page_h))
+    return content, page_w, page_h, (b"".join(idat), width, height)
+
+def write_pdf(pages):
+    """
+    Генератор байтов многостраничного PDF по описаниям страниц
+    (сжатый поток, ширина и высота в pt, картинка или None).
+    Страница отдаётся сразу; в памяти остаются только смещения объектов
+    для таблицы xref, поэтому память не растёт с длиной документа.
+    Объект 1 — каталог, 2 — дерево страниц (оба пишутся в конце),
+    далее объекты каждой страницы.
+    """
+    offsets = {}
+    position = 0
+    kids = []
+
+    def emit(number, body):
+        nonlocal position
+        offsets[number] = position
+        chunk = b"%d 0 obj\n" % number + body + b"\nendobj\n"
+        position += len(chunk)
+        return chunk
+
+    header = b"%PDF-1.4\n%\xe2\xe3\xcf\xd3\n"
+    position = len(header)
+    yield header
+
+    number = 3
+    for content, page_w, page_h, image in pages:
+        resources = b"<< >>"
+        if image is not None:
+            data, width, height = image
+            yield emit(number, b"<< /Type /XObject /Subtype /Image /Width %d /Height %d "
+                               b"/ColorSpace /DeviceRGB /BitsPerComponent 8 /Filter /FlateDecode "
+                               b"/DecodeParms << /Predictor 15 /Colors 3 /BitsPerComponent 8 "
+                               b"/Columns %d >> /Length %d >>\nstream\n"
+                               % (width, height, width, len(data)) + data + b"\nendstream")
+            resources = b"<< /XObject << /Im0 %d 0 R >> >>" % number
+            number += 1
+        yield emit(number, b"<< /Length %d /Filter /FlateDecode >>\nstream\n" % len(content)
+                   + content + b"\nendstream")
+        yield emit(number + 1, b"<< /Type /Page /Parent 2 0 R /MediaBox [0 0 %.2f %.2f] "
+                               b"/Resources %s /Contents %d 0 R >>"
+                               % (page_w, page_h, resources, number))
+        kids.append(number + 1)
+        number += 2
+
+    refs = " ".join("%d 0 R" % kid for kid in kids)
+    yield emit(2, ("<< /Type /Pages /Kids [%s] /Count %d >>" % (refs, len(kids))).encode("latin-1"))
+    yield emit(1, b"<< /Type /Catalog /Pages 2 0 R >>")
+
+    xref = [b"xref\n0 %d\n" % number, b"0000000000 65535 f \n"]
+    xref += [b"%010d 00000 n \n" % offsets[i] for i in range(1, number)]
+    xref.append(b"trailer\n<< /Size %d /Root 1 0 R >>\nstartxref\n%d\n%%EOF\n"
+                % (number, position))
+    yield b"".join(xref)
+
+def stream_pdf(renderer, layouts, **options):
+    """
+    Генератор байтов многостраничного PDF: каждая раскладка
+    превращается в страницу и пишется в поток по очереди.
+    """
+    options = _page_options(renderer, options)
+    return write_pdf(page_spec(layout, options) for layout in layouts)
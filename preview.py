@@ -0,0 +1,74 @@
+# preview.py — быстрый предпросмотр листа в низком разрешении
+#  Раскладка и слои страницы (сетка, буквы) кэшируются по отдельности:
+#  правка одного параметра перерисовывает только зависящий от него слой
+
+import io
+
+from font_on_temp5_to_gost import LRUCache
+from raster_renderer import grid_layers, ink_mask, compose_page
+from render_service import build_renderer
+
+# ------------------ Константы ------------------
+PREVIEW_DPI = 50
+MIN_PREVIEW_DPI, MAX_PREVIEW_DPI = 20, 100
+LAYOUT_CACHE_SIZE = 64
+LAYER_CACHE_SIZE = 16     # покрытие сетки при 50 dpi — десятки КБ на лист
+
+# От каких параметров зависит каждая часть листа (цвета — только от сборки)
+LAYOUT_KEYS = ("lines", "font_path", "spacing", "font_size")
+GRID_KEYS = ("classic_grid", "thin_step_h", "thin_step_v")
+INK_KEYS = ("show_font", "dots_only", "line_width")
+
+LAYOUT_CACHE = LRUCache(LAYOUT_CACHE_SIZE)
+GRID_LAYER_CACHE = LRUCache(LAYER_CACHE_SIZE)
+INK_LAYER_CACHE = LRUCache(LAYER_CACHE_SIZE)
+
+# ------------------ Кэши ------------------
+def _key(params, names):
+    return tuple(tuple(params[n]) if n == "lines" else params[n] for n in names)
+
+def preview_stats():
+    return {"layout": LAYOUT_CACHE.stats(), "grid": GRID_LAYER_CACHE.stats(),
+            "ink": INK_LAYER_CACHE.stats()}
+
+def preview_layout(params):
+    """
+    Раскладка листа; цвета и флаги отрисовки на неё не влияют.
+    """
+    return LAYOUT_CACHE.get(_key(params, LAYOUT_KEYS),
+                            lambda: build_renderer(params).layout(params["lines"]))
+
+# ------------------ Предпросмотр ------------------
+def clamp_dpi(dpi):
+    return min(max(int(dpi), MIN_PREVIEW_DPI), MAX_PREVIEW_DPI)
+
+def preview_image(params, dpi=PREVIEW_DPI):
+    """
+    RGB-изображение листа с разрешением dpi — то же, что PNG для скачивания,
+    но слои берутся из кэша, если их параметры не менялись.
+    """
+    dpi = clamp_dpi(dpi)
+    layout = preview_layout(params)
+    base = _key(params, LAYOUT_KEYS) + (dpi,)
+
+    grid = None
+    if params["show_grid"] and not params["dots_only"]:
+        grid = GRID_LAYER_CACHE.get(
+            base + _key(params, GRID_KEYS),
+            lambda: grid_layers(layout, dpi, params["thin_step_h"], params["thin_step_v"],
+                                params["classic_grid"]))
+    mask = INK_LAYER_CACHE.get(
+        base + _key(params, INK_KEYS),
+        lambda: ink_mask(layout, dpi, params["line_width"], params["show_font"],
+                         params["dots_only"]))
+    return compose_page(layout, dpi, grid, mask, params["frame_color"],
+                        params["grid_color"], params["font_color"])
+
+def preview_png(params, dpi=PREVIEW_DPI):
+    """
+    Байты PNG предпросмотра; сжатие слабое — важнее задержка, чем размер.
+    """
+    image = preview_image(params, dpi)
+    buf = io.BytesIO()
+    image.save(buf, format="PNG", compress_level=1)
+    return buf.getvalue()
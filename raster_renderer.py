@@ -0,0 +1,239 @@
+# raster_renderer.py — PNG напрямую в буфер Pillow/NumPy, без Agg-холста matplotlib
+#  Сетка растеризуется векторно в NumPy по боксам, буквы — полигонами ImageDraw из кэша контуров
+
+import io
+import numpy as np
+from PIL import Image, ImageDraw
+from matplotlib.colors import to_rgb
+
+import metrics
+
+from font_on_temp5_to_gost import (
+    MM_INCH, DEFAULT_DPI, DEFAULT_ANGLE, DEFAULT_THIN_STEP, GRID_LINE_WIDTH,
+    FRAME_LINE_WIDTH, DOT_EDGE_WIDTH, WORD_CACHE_SIZE, LRUCache,
+    grid_segments, clip_segments_to_box, _font_key,
+)
+
+# ------------------ Константы ------------------
+PT_INCH = 72.0
+COVERAGE_CHUNK = 1 << 17   # пикселей отрезков за один векторный проход (~1 МБ на массив)
+PNG_COMPRESS_LEVEL = 3     # zlib: на странице 300 dpi ~0.28 с против ~0.46 с при 6, файл больше на треть
+
+# Полигоны контуров слов в мм (кривые уже разбиты на отрезки)
+POLYGON_CACHE = LRUCache(WORD_CACHE_SIZE)
+
+# ------------------ Вспомогательные функции ------------------
+def _rgb(color):
+    return tuple(int(round(c * 255)) for c in to_rgb(color))
+
+def word_polygons(layout, word, path_mm):
+    key = (_font_key(layout.fontprops), layout.scale, word)
+    return POLYGON_CACHE.get(key, lambda: path_mm.to_polygons(closed_only=True))
+
+def segment_coverage(segments, shape, width_px):
+    """
+    Векторная растеризация отрезков с простым сглаживанием.
+    segments — (N, 2, 2) в пиксельных координатах области (x вправо, y вниз).
+    Возвращает покрытие пикселей float32 в диапазоне [0, 1].
+    """
+    coverage = np.zeros(shape, np.float32)
+    delta = segments[:, 1] - segments[:, 0]
+    steep = np.abs(delta[:, 1]) >= np.abs(delta[:, 0])
+    # Крутые отрезки обходим по строкам, пологие — по столбцам
+    for major, minor, mask in ((1, 0, steep), (0, 1, ~steep)):
+        seg = segments[mask]
+        if not len(seg):
+            continue
+        a0, a1 = seg[:, 0, major], seg[:, 1, major]
+        m0, m1 = seg[:, 0, minor], seg[:, 1, minor]
+        swap = a0 > a1
+        a0, a1 = np.where(swap, a1, a0), np.where(swap, a0, a1)
+        m0, m1 = np.where(swap, m1, m0), np.where(swap, m0, m1)
+
+        first = np.ceil(a0 - 0.5).astype(int)
+        counts = np.maximum(np.floor(a1 - 0.5).astype(int) - first + 1, 0)
+        length = a1 - a0
+        slope = np.divide(m1 - m0, length, out=np.zeros_like(length), where=length > 0)
+
+        # Временные массивы — по пикселю на шаг отрезка, поэтому отрезки
+        # обрабатываются порциями не больше COVERAGE_CHUNK пикселей
+        ends = np.cumsum(counts)
+        start = 0
+        while start < len(seg):
+            stop = max(int(np.searchsorted(ends, ends[start] - counts[start] + COVERAGE_CHUNK,
+                                           side="right")), start + 1)
+            part = slice(start, stop)
+            _add_coverage(coverage, major, first[part], counts[part], a0[part], m0[part],
+                          slope[part], width_px)
+            start = stop
+    return np.minimum(coverage, 1.0, out=coverage)
+
+def _add_coverage(coverage, major, first, counts, a0, m0, slope, width_px):
+    height, width = coverage.shape
+    idx = np.repeat(np.arange(len(counts)), counts)
+    steps = np.arange(counts.sum()) - np.repeat(np.cumsum(counts) - counts, counts)
+    along = first[idx] + steps
+    across = m0[idx] + (along + 0.5 - a0[idx]) * slope[idx] - 0.5
+    # Поперечное сечение наклонной линии шире её толщины
+    weight = width_px * np.sqrt(1.0 + slope[idx] ** 2)
+
+    lower = np.floor(across).astype(int)
+    frac = (across - lower).astype(np.float32)
+    for cells, share in ((lower, 1.0 - frac), (lower + 1, frac)):
+        rows, cols = (along, cells) if major == 1 else (cells, along)
+        inside = (rows >= 0) & (rows < height) & (cols >= 0) & (cols < width)
+        np.add.at(coverage, (rows[inside], cols[inside]), (weight * share)[inside])
+
+# ------------------ Слои страницы ------------------
+# Страница собирается из слоёв: покрытие сетки и маска букв (или точек) не
+# зависят от цветов, поэтому их можно кэшировать и перекрашивать (см. preview.py)
+def page_shape(layout, dpi):
+    """
+    Размер страницы в пикселях: (высота, ширина).
+    """
+    px_mm = dpi / MM_INCH
+    return int(round(layout.page_h * px_mm)), int(round(layout.page_w * px_mm))
+
+def grid_layers(layout, dpi,
+                thin_step_h=DEFAULT_THIN_STEP,
+                thin_step_v=DEFAULT_THIN_STEP,
+                classic_grid=False):
+    """
+    Покрытие сетки по боксам: список (столбец, строка, маска "L"),
+    255 — линия закрывает пиксель целиком. Буфера размером со страницу нет:
+    каждый бокс считается отдельно, пересекающиеся боксы накладываются
+    при сборке по очереди, как при последовательной заливке.
+    """
+    px_mm = dpi / MM_INCH
+    px_pt = dpi / PT_INCH
+    height_px, width_px = page_shape(layout, dpi)
+    layers = []
+    drawn = 0
+    x0, y0, x1, y1 = layout.frame
+    segments = grid_segments(x0, y0, x1, y1, thin_step_h, thin_step_v,
+                             DEFAULT_ANGLE, classic_grid)
+    for box in layout.boxes:
+        visible = clip_segments_to_box(segments, *box)
+        bx, by, bw, bh = box
+        c0 = max(int(np.floor(bx * px_mm)), 0)
+        r0 = max(int(np.floor(height_px - (by + bh) * px_mm)), 0)
+        c1 = min(int(np.ceil((bx + bw) * px_mm)) + 1, width_px)
+        r1 = min(int(np.ceil(height_px - by * px_mm)) + 1, height_px)
+        if not len(visible) or c1 <= c0 or r1 <= r0:
+            continue
+        seg_px = np.empty_like(visible)
+        seg_px[..., 0] = visible[..., 0] * px_mm - c0
+        seg_px[..., 1] = height_px - visible[..., 1] * px_mm - r0
+        coverage = segment_coverage(seg_px, (r1 - r0, c1 - c0), GRID_LINE_WIDTH * px_pt)
+        drawn += len(visible)
+        coverage *= 255.0
+        layers.append((c0, r0, Image.fromarray(np.rint(coverage, out=coverage).astype(np.uint8))))
+    metrics.inc("artists_created_total", drawn, stage="grid", renderer="raster")
+    return layers
+
+def ink_mask(layout, dpi, line_width=None, show_font=True, dots_only=False):
+    """
+    Маска "L" букв или точек в начале слов: 255 — закрашено.
+    """
+    px_mm = dpi / MM_INCH
+    px_pt = dpi / PT_INCH
+    height_px, width_px = page_shape(layout, dpi)
+    mask = Image.new("L", (width_px, height_px), 0)
+    draw = ImageDraw.Draw(mask)
+
+    def to_px(x, y):
+        return x * px_mm, height_px - y * px_mm
+
+    # Точки в начале слов: заливка плюс обводка DOT_EDGE_WIDTH, как у Circle
+    drawn = 0
+    if dots_only or (not show_font):
+        radius = ((layout.cap_height_mm / 14.0) / 2.0) * px_mm + DOT_EDGE_WIDTH * px_pt / 2.0
+        for line in layout.lines:
+            for x_offset, cursor_x in zip(line.x_offsets, line.word_x):
+                cx, cy = to_px(cursor_x + x_offset, line.y)
+                draw.ellipse([cx - radius, cy - radius, cx + radius, cy + radius], fill=255)
+                drawn += 1
+        metrics.inc("artists_created_total", drawn, stage="dots", renderer="raster")
+
+    # Контуры букв
+    if show_font and not dots_only:
+        cap_height = layout.cap_height_mm
+        gost_line_width = (cap_height / 14.0) if line_width is None else line_width
+        stroke = max(int(round(gost_line_width * px_pt)), 1)
+        scale = np.array([px_mm, -px_mm])
+        for line in layout.lines:
+            for word, path_mm, cursor_x in zip(line.words, line.paths, line.word_x):
+                origin = np.array(to_px(cursor_x, line.y))
+                for polygon in word_polygons(layout, word, path_mm):
+                    points = polygon * scale + origin
+                    draw.line(points.ravel().tolist(), fill=255, width=stroke, joint="curve")
+                    drawn += 1
+        metrics.inc("artists_created_total", drawn, stage="glyphs", renderer="raster")
+    return mask
+
+def compose_page(layout, dpi, grid, mask, frame_color, grid_color, font_color):
+    """
+    Собирает RGB-страницу: рамка, сетка по слоям grid_layers() (None — без сетки),
+    затем буквы или точки по маске.
+    """
+    px_mm = dpi / MM_INCH
+    px_pt = dpi / PT_INCH
+    height_px, width_px = page_shape(layout, dpi)
+    image = Image.new("RGB", (width_px, height_px), "white")
+    draw = ImageDraw.Draw(image)
+
+    # Рамка: толщина в пунктах, линия центрирована по контуру, как в matplotlib
+    x0, y0, x1, y1 = layout.frame
+    frame_w = max(int(round(FRAME_LINE_WIDTH * px_pt)), 1)
+    half = frame_w / 2.0
+    draw.rectangle([x0 * px_mm - half, height_px - y1 * px_mm - half,
+                    x1 * px_mm + half, height_px - y0 * px_mm + half],
+                   outline=_rgb(frame_color), width=frame_w)
+
+    # Сетка: цвет заливается в область каждого бокса через его маску покрытия
+    if grid is not None:
+        color = _rgb(grid_color)
+        for c0, r0, coverage in grid:
+            image.paste(color, (c0, r0, c0 + coverage.width, r0 + coverage.height), coverage)
+
+    image.paste(_rgb(font_color), mask=mask)
+    return image
+
+# ------------------ Отрисовка ------------------
+def render_image(renderer, layout,
+                 dpi=DEFAULT_DPI,
+                 line_width=None,
+                 show_grid=True,
+                 show_font=True,
+                 dots_only=False,
+                 classic_grid=False,
+                 thin_step_h=DEFAULT_THIN_STEP,
+                 thin_step_v=DEFAULT_THIN_STEP,
+                 frame_color=None,
+                 grid_color=None,
+                 font_color=None):
+    """
+    Рисует страницу раскладки в RGB-изображение Pillow с заданным разрешением.
+    Параметры по умолчанию берутся из настроек TextRenderer.
+    """
+    line_width = renderer.line_width if line_width is None else line_width
+    frame_color = renderer.frame_color if frame_color is None else frame_color
+    grid_color = renderer.grid_color if grid_color is None else grid_color
+    font_color = renderer.font_color if font_color is None else font_color
+
+    grid = None
+    if show_grid and not dots_only:
+        with metrics.stage("grid"):
+            grid = grid_layers(layout, dpi, thin_step_h, thin_step_v, classic_grid)
+    with metrics.stage("glyphs" if show_font and not dots_only else "dots"):
+        mask = ink_mask(layout, dpi, line_width, show_font, dots_only)
+    return compose_page(layout, dpi, grid, mask, frame_color, grid_color, font_color)
+
+def render_png(renderer, layout, dpi=DEFAULT_DPI, **options):
+    """
+    Возвращает байты PNG страницы с разрешением dpi.
+    """
+    image = render_image(renderer, layout, dpi=dpi, **options)
+    buf = io.BytesIO()
+    image.save(buf, format="PNG", dpi=(dpi, dpi), compress_level=PNG_COMPRESS_LEVEL)
+    return buf.getvalue()
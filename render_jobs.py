@@ -0,0 +1,259 @@
+# render_jobs.py — асинхронные задания рендера на ограниченном пуле процессов
+#  Задание пишет результаты и свой статус в общее хранилище; веб-воркер только ставит и опрашивает
+
+import os
+import re
+import threading
+import time
+from concurrent.futures import CancelledError, ProcessPoolExecutor, TimeoutError as FutureTimeout
+from concurrent.futures.process import BrokenProcessPool
+
+import metrics
+from result_store import ResultStore
+from render_service import (FORMATS, TRAINING_GIF, document_name, ensure_document,
+                            ensure_output, ensure_training)
+from parallel_render import PAGE_FORMATS
+
+# ------------------ Константы ------------------
+JOB_KINDS = ("render", "training", "document")
+JOB_FILE_PREFIX = "job-"
+JOB_STALE = 600.0       # сек: незавершённое задание старше считается потерянным (воркер умер)
+JOB_POLL = 0.2          # сек между проверками статуса задания чужого воркера
+ACTIVE_STATUSES = ("queued", "running")
+
+# job_id — "<render_id>-training", "<render_id>-render-pdf-png" или
+# "<render_id>-document-png": по нему любой воркер находит файл статуса в каталоге рендера
+JOB_ID_RE = re.compile(r"^([0-9a-f]{16,64})-(training|(?:render|document)(?:-[a-z]+)*)$")
+
+class QueueFullError(Exception):
+    """
+    Очередь заполнена: задание не принято (лимит допуска).
+    """
+
+# ------------------ Статус задания в хранилище ------------------
+def job_id_for(kind, render_id, formats=()):
+    name = "training" if kind == "training" else "-".join([kind] + list(formats))
+    return f"{render_id}-{name}"
+
+def parse_job_id(job_id):
+    """
+    (render_id, имя задания) или (None, None) для некорректного job_id.
+    """
+    match = JOB_ID_RE.match(job_id or "")
+    return match.groups() if match else (None, None)
+
+def read_job(store, job_id):
+    render_id, name = parse_job_id(job_id)
+    if render_id is None:
+        return None
+    return store.get_json(render_id, f"{JOB_FILE_PREFIX}{name}.json")
+
+def write_job(store, info):
+    render_id, name = parse_job_id(info["job_id"])
+    store.put_json(render_id, f"{JOB_FILE_PREFIX}{name}.json", info)
+
+def _update_job(store, job_id, **fields):
+    info = read_job(store, job_id) or {"job_id": job_id}
+    info.update(fields)
+    write_job(store, info)
+
+def _is_active(info):
+    return (info.get("status") in ACTIVE_STATUSES
+            and time.time() - info.get("submitted", 0) < JOB_STALE)
+
+# ------------------ Функции, выполняемые в процессах пула ------------------
+# Задание возвращает {"outputs": [...], "metrics": снимок metrics.collect()}:
+# этапы и байты, замеренные в процессе пула, попадают в /metrics веб-воркера.
+# Процесс пула выполняет одно задание за раз, поэтому счётчики обнуляются
+# перед каждым (после fork в них и унаследованные от веб-воркера)
+def run_render_job(store_args, job_id, formats):
+    """
+    Строит форматы рендера по сохранённым параметрам и кладёт их в хранилище.
+    """
+    metrics.reset()
+    store = ResultStore(*store_args)
+    render_id, _ = parse_job_id(job_id)
+    _update_job(store, job_id, status="running", started=time.time())
+    done = []
+    for fmt in formats:
+        if ensure_output(store, render_id, fmt) is None:
+            raise LookupError(f"Рендер {render_id} не найден в хранилище")
+        done.append(fmt)
+    return {"outputs": done, "metrics": metrics.collect()}
+
+def run_training_job(store_args, job_id):
+    """
+    Строит gif-анимацию обучения по тексту рендера и кладёт её в хранилище.
+    Пустой список outputs — в тексте нет букв с изображениями.
+    """
+    metrics.reset()
+    store = ResultStore(*store_args)
+    render_id, _ = parse_job_id(job_id)
+    if store.get_params(render_id) is None:
+        raise LookupError(f"Рендер {render_id} не найден в хранилище")
+    _update_job(store, job_id, status="running", started=time.time())
+    outputs = [TRAINING_GIF] if ensure_training(store, render_id) else []
+    return {"outputs": outputs, "metrics": metrics.collect()}
+
+def run_document_job(store_args, job_id, pages):
+    """
+    Строит многостраничный PDF по тексту рендера и кладёт его в хранилище.
+    Страницы рендерятся по очереди в этом процессе: документ занимает один
+    процесс пула, как и любое другое задание.
+    """
+    metrics.reset()
+    store = ResultStore(*store_args)
+    render_id, _ = parse_job_id(job_id)
+    _update_job(store, job_id, status="running", started=time.time())
+    if ensure_document(store, render_id, pages) is None:
+        raise LookupError(f"Рендер {render_id} не найден в хранилище")
+    return {"outputs": [document_name(pages)], "metrics": metrics.collect()}
+
+# ------------------ Очередь заданий ------------------
+class JobQueue:
+    """
+    Принимает задания рендера и выполняет их на пуле процессов. Лимит допуска
+    max_pending ограничивает глубину очереди: сверх него submit() бросает
+    QueueFullError. Пул и лимит — на один веб-воркер, поэтому их задают
+    долей от общих (см. RENDER_WORKERS в app.py).
+    Статус задания — файл в каталоге рендера общего хранилища: опросить
+    задание и скачать результат можно с любого воркера gunicorn.
+    """
+
+    def __init__(self, store, workers=None, max_pending=None):
+        self.store = store
+        self.workers = workers or os.cpu_count() or 1
+        self.max_pending = max_pending or self.workers * 4
+        self._executor = None
+        self._futures = {}      # job_id -> Future незавершённых заданий этого воркера
+        self._lock = threading.RLock()
+        self.submitted = 0
+        self.rejected = 0
+        self.failed = 0
+
+    def _pool(self):
+        # Пул создаётся при первом задании, а не при импорте приложения
+        if self._executor is None:
+            self._executor = ProcessPoolExecutor(max_workers=self.workers)
+        return self._executor
+
+    def _store_args(self):
+        return (self.store.root, self.store.max_bytes, self.store.max_entries)
+
+    # -----------------------------------------------------
+    def submit(self, kind, render_id, formats=tuple(FORMATS)):
+        """
+        Ставит задание в очередь и возвращает job_id. Повторное задание
+        на тот же рендер, пока первое не завершено (в любом воркере),
+        получает тот же job_id.
+        """
+        if kind not in JOB_KINDS:
+            raise ValueError(f"Неизвестный тип задания: {kind}")
+        if kind == "render":
+            formats = [fmt for fmt in FORMATS if fmt in formats]
+        elif kind == "document":
+            # formats — один формат страниц: pdf или png
+            formats = [fmt for fmt in PAGE_FORMATS if fmt in formats][:1] or ["pdf"]
+        else:
+            formats = []
+        job_id = job_id_for(kind, render_id, formats)
+        with self._lock:
+            if job_id in self._futures:
+                return job_id
+            info = read_job(self.store, job_id)
+            if info and _is_active(info):
+                return job_id
+            if len(self._futures) >= self.max_pending:
+                self.rejected += 1
+                raise QueueFullError(f"В очереди уже {self.max_pending} заданий")
+
+            write_job(self.store, {"job_id": job_id, "kind": kind, "render_id": render_id,
+                                   "formats": formats, "status": "queued",
+                                   "submitted": time.time()})
+            if kind == "render":
+                call = (run_render_job, self._store_args(), job_id, formats)
+            elif kind == "document":
+                call = (run_document_job, self._store_args(), job_id, formats[0])
+            else:
+                call = (run_training_job, self._store_args(), job_id)
+            try:
+                future = self._pool().submit(*call)
+            except BrokenProcessPool:
+                # Процесс пула упал (например, по памяти) — поднимаем пул заново
+                self._executor = None
+                future = self._pool().submit(*call)
+            self._futures[job_id] = future
+            self.submitted += 1
+        future.add_done_callback(lambda f: self._on_done(job_id, f))
+        return job_id
+
+    def find(self, kind, render_id, formats=()):
+        """
+        job_id задания этого типа на рендер или None, если его не ставили.
+        """
+        job_id = job_id_for(kind, render_id, formats)
+        return job_id if read_job(self.store, job_id) is not None else None
+
+    def _on_done(self, job_id, future):
+        if future.cancelled():
+            fields = {"status": "failed", "error": "cancelled"}
+        elif future.exception() is not None:
+            fields = {"status": "failed", "error": str(future.exception())}
+        else:
+            result = future.result()
+            metrics.merge(result["metrics"])
+            fields = {"status": "done", "outputs": result["outputs"]}
+        with self._lock:
+            self._futures.pop(job_id, None)
+            if fields["status"] == "failed":
+                self.failed += 1
+        _update_job(self.store, job_id, finished=time.time(), **fields)
+
+    # -----------------------------------------------------
+    def status(self, job_id):
+        """
+        Словарь со статусом задания: queued / running / done / failed.
+        None — если задание неизвестно (или вытеснено вместе с рендером).
+        """
+        info = read_job(self.store, job_id)
+        if info is None:
+            return None
+        if info["status"] in ACTIVE_STATUSES and not _is_active(info):
+            info.update(status="failed", error="Задание потеряно: воркер не завершил его")
+        return info
+
+    def wait(self, job_id, timeout=None):
+        """
+        Ждёт завершения задания не дольше timeout секунд и возвращает статус.
+        Задание другого воркера ожидается опросом файла статуса.
+        """
+        with self._lock:
+            future = self._futures.get(job_id)
+        if future is not None:
+            try:
+                future.exception(timeout=timeout)
+            except (FutureTimeout, CancelledError):
+                pass
+        # Файл статуса пишет колбэк: он может отставать от future на мгновение
+        deadline = time.monotonic() + (timeout or 0)
+        info = self.status(job_id)
+        while info is not None and info["status"] in ACTIVE_STATUSES \
+                and time.monotonic() < deadline:
+            time.sleep(JOB_POLL)
+            info = self.status(job_id)
+        return info
+
+    def metrics(self):
+        with self._lock:
+            futures = list(self._futures.values())
+            counters = {"submitted": self.submitted, "rejected": self.rejected,
+                        "failed": self.failed}
+        running = sum(1 for f in futures if f.running())
+        pending = sum(1 for f in futures if not f.done())
+        return dict(counters, workers=self.workers, max_pending=self.max_pending,
+                    running=running, queued=pending - running)
+
+    def shutdown(self):
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
@@ -0,0 +1,248 @@
+# render_service.py — форматы вывода по параметрам рендера
+#  Параметры формы -> TextRenderer + раскладка -> байты PDF / PNG / SVG по запросу
+
+import hashlib
+import json
+import math
+import os
+import threading
+
+from matplotlib.colors import is_color_like
+
+from font_on_temp5_to_gost import TextRenderer, PREWARM_TEXT, prewarm_fonts
+from pdf_renderer import render_pdf, stream_pdf
+from raster_renderer import render_png
+from svg_renderer import render_svg
+import metrics
+
+# ------------------ Константы ------------------
+# Формат -> (MIME-тип, имя файла при скачивании)
+FORMATS = {
+    "pdf": ("application/pdf", "gost_titul.pdf"),
+    "png": ("image/png", "gost_titul.png"),
+    "svg": ("image/svg+xml", "gost_output.svg"),
+}
+PNG_DPI = 300
+PREWARM_DPI = 20      # PNG прогрева: важен путь кода, а не размер
+DOCUMENT_NAME = "gost_document.pdf"   # многостраничный PDF длинного текста
+TRAINING_GIF = "training_images.gif"   # gif-анимация обучения, если её заказывали
+TRAINING_MIMETYPE = "image/gif"
+TRAINING_REQUEST = "training.json"     # отметка: к рендеру заказана анимация обучения
+BUNDLE_NAME = "gost_titul.zip"
+FILE_CHUNK = 64 * 1024
+
+# Какие параметры идут в конструктор TextRenderer, а какие — во флаги отрисовки
+RENDERER_KEYS = ("font_path", "spacing", "font_size", "line_width",
+                 "frame_color", "grid_color", "font_color")
+FLAG_KEYS = ("show_grid", "show_font", "dots_only", "classic_grid",
+             "thin_step_h", "thin_step_v")
+
+# Счётчики кэша готовых форматов (на процесс воркера)
+_stats_lock = threading.Lock()
+_stats = {"hits": 0, "misses": 0, "reused": 0}
+
+# ------------------ Ключ содержимого ------------------
+def normalize_params(params):
+    """
+    Приводит параметры к каноническому виду: одинаковый по смыслу
+    запрос даёт одинаковый словарь (и одинаковый ключ).
+    """
+    normalized = {}
+    for key, value in params.items():
+        if isinstance(value, float):
+            value = round(value, 6)
+        elif key.endswith("_color") and isinstance(value, str):
+            value = value.strip().lower()
+        elif key == "lines":
+            value = [str(line) for line in value]
+        normalized[key] = value
+    return normalized
+
+def validate_params(params):
+    """
+    Проверяет цвета и шаги сетки до сохранения: ValueError с описанием поля.
+    Ошибка при отрисовке оборвала бы потоковый ответ, а нулевой шаг не даёт сетку построить.
+    """
+    for key in ("frame_color", "grid_color", "font_color"):
+        if not is_color_like(str(params[key]).strip()):
+            raise ValueError(f"{key}: некорректный цвет {params[key]!r}")
+    for key in ("thin_step_h", "thin_step_v"):
+        if not (math.isfinite(params[key]) and params[key] > 0):
+            raise ValueError(f"{key}: шаг сетки должен быть больше нуля")
+    return params
+
+def render_key(params):
+    """
+    SHA-256 нормализованных параметров — он же render_id в хранилище.
+    """
+    blob = json.dumps(normalize_params(params), sort_keys=True,
+                      ensure_ascii=False, separators=(",", ":"))
+    return hashlib.sha256(blob.encode("utf-8")).hexdigest()
+
+def _count(name):
+    with _stats_lock:
+        _stats[name] += 1
+
+def output_stats():
+    with _stats_lock:
+        return dict(_stats)
+
+def store_params(store, params):
+    """
+    Сохраняет параметры под их ключом содержимого и возвращает render_id.
+    Если такой рендер уже есть, его готовые форматы переиспользуются.
+    """
+    params = normalize_params(params)
+    render_id = render_key(params)
+    if store.get_params(render_id) is None:
+        store.put_params(render_id, params)
+    else:
+        _count("reused")
+    return render_id
+
+# ------------------ Рендер форматов ------------------
+def build_renderer(params):
+    return TextRenderer(**{k: params[k] for k in RENDERER_KEYS})
+
+def render_flags(params):
+    return {k: params[k] for k in FLAG_KEYS}
+
+def render_format(renderer, layout, flags, fmt):
+    """
+    Сериализует готовую раскладку в один формат и возвращает байты.
+    """
+    if fmt == "pdf":
+        return render_pdf(renderer, layout, **flags)
+    if fmt == "png":
+        return render_png(renderer, layout, dpi=PNG_DPI, **flags)
+    if fmt == "svg":
+        return render_svg(renderer, layout, **flags)
+    raise ValueError(f"Неизвестный формат: {fmt}")
+
+def output_name(fmt):
+    return f"output.{fmt}"
+
+def ensure_output(store, render_id, fmt):
+    """
+    Путь к файлу формата fmt в хранилище; при первом обращении формат
+    строится по сохранённым параметрам. None — если рендер неизвестен или вытеснен.
+    """
+    name = output_name(fmt)
+    path = store.path(render_id, name)
+    if path:
+        _count("hits")
+        return path
+    params = store.get_params(render_id)
+    if params is None:
+        return None
+    _count("misses")
+    renderer = build_renderer(params)
+    layout = renderer.layout(params["lines"])
+    with metrics.stage(fmt):
+        data = render_format(renderer, layout, render_flags(params), fmt)
+    metrics.inc("bytes_written_total", len(data), format=fmt)
+    return store.put(render_id, name, data)
+
+def request_training(store, render_id):
+    """
+    Отмечает в хранилище, что к рендеру заказана анимация: архив её дождётся.
+    """
+    store.put_json(render_id, TRAINING_REQUEST, {"training": True})
+
+def ensure_training(store, render_id):
+    """
+    Путь к gif-анимации обучения в хранилище; при первом обращении она строится
+    по тексту рендера. None — если рендер неизвестен или в тексте нет букв
+    с изображениями.
+    """
+    path = store.path(render_id, TRAINING_GIF)
+    if path:
+        return path
+    params = store.get_params(render_id)
+    if params is None:
+        return None
+    # Pillow-кодек анимации грузится при первом задании, а не при старте воркера
+    from training_animation import animation_bytes
+    with metrics.stage("gif"):
+        data = animation_bytes(params["lines"])
+    if data is None:
+        return None
+    metrics.inc("bytes_written_total", len(data), format="gif")
+    return store.put(render_id, TRAINING_GIF, data)
+
+def prewarm(font_paths):
+    """
+    Прогрев до первого запроса: шрифты (масштаб, метрики, контуры) и кодеки
+    PDF / PNG / SVG на образце из одной строки. Возвращает число шрифтов.
+    """
+    renderers = prewarm_fonts(font_paths)
+    if renderers:
+        renderer = next(iter(renderers.values()))
+        layout = renderer.layout([PREWARM_TEXT])
+        render_pdf(renderer, layout)
+        render_png(renderer, layout, dpi=PREWARM_DPI)
+        render_svg(renderer, layout)
+    return len(renderers)
+
+def stream_document(params):
+    """
+    Генератор байтов многостраничного PDF: строки переносятся по страницам,
+    каждая страница раскладывается и пишется в поток по очереди.
+    """
+    renderer = build_renderer(params)
+    return stream_pdf(renderer, renderer.layout_pages(params["lines"]), **render_flags(params))
+
+def document_name(pages):
+    return "document.pdf" if pages == "pdf" else f"document-{pages}.pdf"
+
+def ensure_document(store, render_id, pages="pdf"):
+    """
+    Путь к многостраничному PDF в хранилище; при первом обращении он строится
+    по сохранённым параметрам и пишется на диск по страницам.
+    pages="png" — растровые страницы. None — если рендер неизвестен или вытеснен.
+    """
+    name = document_name(pages)
+    path = store.path(render_id, name)
+    if path:
+        return path
+    params = store.get_params(render_id)
+    if params is None:
+        return None
+    if pages == "pdf":
+        chunks = stream_document(params)
+    else:
+        from parallel_render import render_document   # он сам импортирует этот модуль
+        chunks = render_document(params, pages, workers=1)
+    with metrics.stage("document"):
+        path = store.put_chunks(render_id, name, chunks)
+    metrics.inc("bytes_written_total", os.path.getsize(path), format="document")
+    return path
+
+# ------------------ Архив всех форматов ------------------
+def file_chunks(path, size=FILE_CHUNK):
+    """
+    Читает файл частями: в памяти не больше одной части.
+    """
+    with open(path, "rb") as fh:
+        while True:
+            chunk = fh.read(size)
+            if not chunk:
+                return
+            yield chunk
+
+def bundle_files(store, render_id):
+    """
+    Пары (имя в архиве, части файла) для всех форматов рендера и gif-анимации,
+    если её заказывали. Недостающие форматы и анимация, которую фоновое
+    задание ещё не успело построить, строятся по очереди, уже во время
+    отдачи архива.
+    """
+    for fmt, (_, download_name) in FORMATS.items():
+        path = ensure_output(store, render_id, fmt)
+        if path is not None:
+            yield download_name, file_chunks(path)
+    gif_path = store.path(render_id, TRAINING_GIF)
+    if gif_path is None and store.get_json(render_id, TRAINING_REQUEST) is not None:
+        gif_path = ensure_training(store, render_id)
+    if gif_path is not None:
+        yield TRAINING_GIF, file_chunks(gif_path)
@@ -0,0 +1,186 @@
+# result_store.py — общее для всех воркеров хранилище результатов рендера
+#  Каталог на каждый render_id: params.json и файлы форматов; вытеснение LRU по размеру
+
+import json
+import os
+import re
+import shutil
+import tempfile
+import threading
+import time
+
+# ------------------ Константы ------------------
+DEFAULT_MAX_BYTES = 512 * 1024 * 1024
+DEFAULT_MAX_ENTRIES = 10000
+EVICT_INTERVAL = 30.0      # сек между полными обходами каталога, если лимиты не превышены
+EVICT_TARGET = 0.9         # вытеснение освобождает место с запасом до 90% лимитов
+PARAMS_FILE = "params.json"
+RENDER_ID_RE = re.compile(r"^[0-9a-f]{16,64}$")
+
+class ResultStore:
+    """
+    Хранилище результатов на диске, разделяемое воркерами gunicorn.
+    Запись атомарная (временный файл + os.replace), чтение — прямо с диска,
+    поэтому send_file отдаёт файл без копирования в память.
+    Время последнего обращения — mtime каталога рендера; при превышении
+    max_bytes (или числа рендеров max_entries) удаляются самые давние.
+
+    Полный обход каталога стоит O(числа рендеров), поэтому запись его
+    не делает: размер и число рендеров ведутся по последнему обходу плюс
+    собственные записи процесса. Обход и вытеснение — когда эта оценка
+    превышает лимит или прошло EVICT_INTERVAL секунд (записи других
+    воркеров учитываются при следующем обходе).
+    """
+
+    def __init__(self, root, max_bytes=DEFAULT_MAX_BYTES, max_entries=DEFAULT_MAX_ENTRIES):
+        self.root = root
+        self.max_bytes = max_bytes
+        self.max_entries = max_entries
+        self._lock = threading.Lock()
+        self._bytes = 0
+        self._count = 0
+        self._scanned_at = None
+        os.makedirs(root, exist_ok=True)
+
+    # -----------------------------------------------------
+    @staticmethod
+    def valid_id(render_id):
+        return bool(render_id) and RENDER_ID_RE.match(render_id) is not None
+
+    def _dir(self, render_id):
+        if not self.valid_id(render_id):
+            raise ValueError(f"Некорректный идентификатор рендера: {render_id!r}")
+        return os.path.join(self.root, render_id)
+
+    def _write(self, render_id, name, chunks):
+        folder = self._dir(render_id)
+        created = not os.path.isdir(folder)
+        os.makedirs(folder, exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(dir=folder, prefix=".tmp-")
+        size = 0
+        try:
+            with os.fdopen(fd, "wb") as fh:
+                for chunk in chunks:
+                    fh.write(chunk)
+                    size += len(chunk)
+            os.replace(tmp_path, os.path.join(folder, name))
+        except BaseException:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise
+        self.touch(render_id)
+        with self._lock:
+            self._bytes += size
+            self._count += int(created)
+        if self._over_limits() or self._scan_due():
+            self.evict()
+        return os.path.join(folder, name)
+
+    # -----------------------------------------------------
+    def put_json(self, render_id, name, value):
+        data = json.dumps(value, ensure_ascii=False).encode("utf-8")
+        return self._write(render_id, name, (data,))
+
+    def get_json(self, render_id, name):
+        """
+        Содержимое JSON-файла рендера или None, если файла нет.
+        """
+        if not self.valid_id(render_id):
+            return None
+        try:
+            with open(os.path.join(self._dir(render_id), name), "rb") as fh:
+                value = json.loads(fh.read().decode("utf-8"))
+        except FileNotFoundError:
+            return None
+        self.touch(render_id)
+        return value
+
+    def put_params(self, render_id, params):
+        self.put_json(render_id, PARAMS_FILE, params)
+
+    def get_params(self, render_id):
+        return self.get_json(render_id, PARAMS_FILE)
+
+    def put(self, render_id, name, data):
+        """
+        Сохраняет готовый файл рендера и возвращает путь к нему.
+        """
+        return self._write(render_id, name, (data,))
+
+    def put_chunks(self, render_id, name, chunks):
+        """
+        Как put(), но файл пишется по частям из генератора: длинный документ
+        не собирается в памяти. Пока генератор не исчерпан, файла под именем name нет.
+        """
+        return self._write(render_id, name, chunks)
+
+    def path(self, render_id, name):
+        """
+        Путь к сохранённому файлу или None, если его ещё нет (или он вытеснен).
+        """
+        if not self.valid_id(render_id):
+            return None
+        file_path = os.path.join(self._dir(render_id), name)
+        if not os.path.isfile(file_path):
+            return None
+        self.touch(render_id)
+        return file_path
+
+    def touch(self, render_id):
+        try:
+            os.utime(self._dir(render_id))
+        except FileNotFoundError:
+            pass
+
+    # -----------------------------------------------------
+    def _entries(self):
+        entries = []
+        for name in os.listdir(self.root):
+            folder = os.path.join(self.root, name)
+            try:
+                size = sum(entry.stat().st_size for entry in os.scandir(folder)
+                           if entry.is_file())
+                entries.append((os.stat(folder).st_mtime, size, folder))
+            except (FileNotFoundError, NotADirectoryError):
+                continue   # каталог удалил другой воркер
+        return entries
+
+    def _over_limits(self, share=1.0):
+        return (self._bytes > self.max_bytes * share
+                or (self.max_entries is not None and self._count > self.max_entries * share))
+
+    def _scan_due(self):
+        return (self._scanned_at is None
+                or time.monotonic() - self._scanned_at >= EVICT_INTERVAL)
+
+    def evict(self):
+        """
+        Полный обход: удаляет самые давние рендеры, если превышен лимит размера
+        или числа (до EVICT_TARGET от лимитов), и обновляет оценку заполненности.
+        """
+        with self._lock:
+            entries = sorted(self._entries())
+            self._bytes = sum(size for _, size, _ in entries)
+            self._count = len(entries)
+            self._scanned_at = time.monotonic()
+            if not self._over_limits():
+                return
+            # Самый свежий рендер не трогаем, даже если он один больше лимита
+            for _, size, folder in entries[:-1]:
+                if not self._over_limits(EVICT_TARGET):
+                    break
+                shutil.rmtree(folder, ignore_errors=True)
+                self._bytes -= size
+                self._count -= 1
+
+    def stats(self):
+        """
+        Заполненность по последнему обходу (не старше EVICT_INTERVAL) и своим записям.
+        """
+        if self._scan_due():
+            self.evict()
+        with self._lock:
+            return {"renders": self._count,
+                    "bytes": self._bytes,
+                    "max_bytes": self.max_bytes,
+                    "max_entries": self.max_entries}
@@ -0,0 +1,244 @@
+# svg_renderer.py — SVG напрямую по раскладке TextRenderer, без matplotlib-фигуры
+#  Сетка — один плиточный <pattern> на все боксы, каждый глиф — один <symbol>,
+#  который ставится в строки через <use>
+
+import numpy as np
+from matplotlib.colors import to_hex
+from matplotlib.path import Path
+
+import metrics
+
+from font_on_temp5_to_gost import (
+    MM_INCH, DEFAULT_ANGLE, DEFAULT_THIN_STEP, GRID_LINE_WIDTH, FRAME_LINE_WIDTH,
+    DOT_EDGE_WIDTH, WORD_CACHE_SIZE, LRUCache, _font_key,
+)
+from glyph_atlas import get_atlas
+from pdf_renderer import _page_options
+
+# ------------------ Константы ------------------
+PT_PER_MM = 72.0 / MM_INCH
+SVG_NS = "http://www.w3.org/2000/svg"
+XLINK_NS = "http://www.w3.org/1999/xlink"
+
+# Данные контуров <path d="..."> в мм: глифы атласа и слова вне атласа
+SVG_PATH_CACHE = LRUCache(WORD_CACHE_SIZE)
+
+# ------------------ Числа и контуры ------------------
+def _num(value):
+    # Три знака после запятой, без хвостовых нулей: 12.500 -> 12.5, 3.000 -> 3
+    text = "%.3f" % value
+    text = text.rstrip("0").rstrip(".")
+    return "0" if text in ("", "-0") else text
+
+def _color(color):
+    return to_hex(color)
+
+def path_data(verts, codes):
+    """
+    Переводит вершины и коды matplotlib Path в данные SVG-пути.
+    Квадратичные кривые TrueType остаются квадратичными (Q).
+    """
+    if codes is None:
+        codes = np.full(len(verts), Path.LINETO)
+        codes[0] = Path.MOVETO
+    parts = []
+    i, n = 0, len(codes)
+    while i < n:
+        code = codes[i]
+        if code == Path.MOVETO:
+            parts.append("M%s %s" % (_num(verts[i][0]), _num(verts[i][1])))
+            i += 1
+        elif code == Path.LINETO:
+            parts.append("L%s %s" % (_num(verts[i][0]), _num(verts[i][1])))
+            i += 1
+        elif code == Path.CURVE3:
+            parts.append("Q%s %s %s %s" % (_num(verts[i][0]), _num(verts[i][1]),
+                                           _num(verts[i + 1][0]), _num(verts[i + 1][1])))
+            i += 2
+        elif code == Path.CURVE4:
+            parts.append("C%s %s %s %s %s %s" % (
+                _num(verts[i][0]), _num(verts[i][1]), _num(verts[i + 1][0]),
+                _num(verts[i + 1][1]), _num(verts[i + 2][0]), _num(verts[i + 2][1])))
+            i += 3
+        elif code == Path.CLOSEPOLY:
+            parts.append("Z")
+            i += 1
+        else:  # Path.STOP
+            i += 1
+    return "".join(parts)
+
+def glyph_data(layout, atlas, index):
+    """
+    Контур глифа атласа в мм (масштаб раскладки), начало — в точке пера.
+    """
+    key = (_font_key(layout.fontprops), layout.scale, "glyph", index)
+
+    def build():
+        start, stop = atlas.offsets[index], atlas.offsets[index + 1]
+        return path_data(np.asarray(atlas.vertices[start:stop]) * layout.scale,
+                         atlas.codes[start:stop])
+    return SVG_PATH_CACHE.get(key, build)
+
+def word_data(layout, word, path_mm):
+    key = (_font_key(layout.fontprops), layout.scale, "word", word)
+    return SVG_PATH_CACHE.get(key, lambda: path_data(path_mm.vertices, path_mm.codes))
+
+# ------------------ Части документа ------------------
+class _Symbols:
+    """
+    Реестр <symbol> документа: каждый глиф (или слово вне атласа) — один раз.
+    """
+
+    def __init__(self):
+        self.ids = {}
+        self.defs = []
+
+    def get(self, key, build):
+        symbol_id = self.ids.get(key)
+        if symbol_id is None:
+            symbol_id = self.ids[key] = f"s{len(self.ids)}"
+            self.defs.append(f'<symbol id="{symbol_id}" overflow="visible">'
+                             f'<path d="{build()}"/></symbol>')
+        return symbol_id
+
+def _use(symbol_id, x, y):
+    return f'<use xlink:href="#{symbol_id}" x="{_num(x)}" y="{_num(y)}"/>'
+
+def grid_pattern(layout, thin_step_h, thin_step_v, classic_grid, grid_color):
+    """
+    Плитка сетки: одна горизонтальная и одна вертикальная линия на ячейку
+    thin_step_v × thin_step_h. Наклон даёт skewX в patternTransform,
+    начало совпадает с первой линией grid_segments(). Линии лежат в середине
+    плитки, чтобы штрих не обрезался её краем.
+    """
+    x0, y0, x1, y1 = layout.frame
+    angle = 0.0 if classic_grid else -DEFAULT_ANGLE
+    slope = np.tan(np.radians(angle))
+    half_w, half_h = thin_step_v / 2.0, thin_step_h / 2.0
+    origin_x = (x0 - (y1 - y0)) - half_w - half_h * slope
+    origin_y = y0 - half_h
+    stroke = GRID_LINE_WIDTH / PT_PER_MM
+    return (f'<pattern id="grid" patternUnits="userSpaceOnUse" '
+            f'width="{_num(thin_step_v)}" height="{_num(thin_step_h)}" '
+            f'patternTransform="translate({_num(origin_x)} {_num(origin_y)}) '
+            f'skewX({_num(angle)})">'
+            f'<path d="M0 {_num(half_h)}H{_num(thin_step_v)}M{_num(half_w)} 0V{_num(thin_step_h)}" '
+            f'fill="none" stroke="{_color(grid_color)}" stroke-width="{_num(stroke)}"/>'
+            f'</pattern>')
+
+def grid_rects(layout):
+    """
+    Боксы строк, обрезанные рамкой: сетка не выходит за её пределы.
+    """
+    x0, y0, x1, y1 = layout.frame
+    rects = []
+    for bx, by, bw, bh in layout.boxes:
+        left, bottom = max(bx, x0), max(by, y0)
+        right, top = min(bx + bw, x1), min(by + bh, y1)
+        if right > left and top > bottom:
+            rects.append(f'<rect x="{_num(left)}" y="{_num(bottom)}" '
+                         f'width="{_num(right - left)}" height="{_num(top - bottom)}"/>')
+    return rects
+
+def text_uses(layout, symbols):
+    """
+    <use> для каждого глифа: позиции символов — как у контура слова
+    (продвижения и кернинг атласа), слова вне атласа ставятся целиком.
+    """
+    font_file = layout.fontprops.get_file()
+    atlas = get_atlas(font_file) if font_file else None
+    uses = []
+    for line in layout.lines:
+        for j, (word, cursor_x) in enumerate(zip(line.words, line.word_x)):
+            indices = atlas.indices(word) if atlas is not None and "$" not in word else None
+            if indices is None:
+                path_mm = line.paths[j]
+                symbol_id = symbols.get(("word", word),
+                                        lambda: word_data(layout, word, path_mm))
+                uses.append(_use(symbol_id, cursor_x, line.y))
+                continue
+            # Контур слова сдвинут на -x_offset, так что перо стоит левее его края
+            pen_x = cursor_x - line.x_offsets[j]
+            for index, x in zip(indices, atlas.positions(indices)):
+                if atlas.offsets[index + 1] == atlas.offsets[index]:
+                    continue   # пробел и прочие глифы без контура
+                symbol_id = symbols.get(("glyph", index),
+                                        lambda: glyph_data(layout, atlas, index))
+                uses.append(_use(symbol_id, pen_x + x * layout.scale, line.y))
+    return uses
+
+# ------------------ Документ ------------------
+def svg_document(layout,
+                 line_width=None,
+                 show_grid=True,
+                 show_font=True,
+                 dots_only=False,
+                 classic_grid=False,
+                 thin_step_h=DEFAULT_THIN_STEP,
+                 thin_step_v=DEFAULT_THIN_STEP,
+                 frame_color="black",
+                 grid_color="black",
+                 font_color="black"):
+    """
+    Текст SVG одной страницы раскладки. Координаты — в мм, ось y вверх,
+    как у раскладки (переворот — в корневой группе).
+    Толщины линий — в пунктах, как в matplotlib.
+    """
+    w, h = layout.page_w, layout.page_h
+    defs, body = [], []
+
+    # Рамка
+    x0, y0, x1, y1 = layout.frame
+    body.append(f'<rect x="{_num(x0)}" y="{_num(y0)}" width="{_num(x1 - x0)}" '
+                f'height="{_num(y1 - y0)}" fill="none" stroke="{_color(frame_color)}" '
+                f'stroke-width="{_num(FRAME_LINE_WIDTH / PT_PER_MM)}"/>')
+
+    # Сетка: боксы строк заливаются плиткой
+    if show_grid and not dots_only:
+        rects = grid_rects(layout)
+        metrics.inc("artists_created_total", len(rects), stage="grid", renderer="svg")
+        if rects:
+            defs.append(grid_pattern(layout, thin_step_h, thin_step_v, classic_grid, grid_color))
+            body.append('<g fill="url(#grid)">' + "".join(rects) + "</g>")
+
+    # Точки в начале слов
+    if dots_only or (not show_font):
+        radius = (layout.cap_height_mm / 14.0) / 2.0
+        defs.append(f'<circle id="dot" r="{_num(radius)}"/>')
+        dots = [_use("dot", cursor_x + x_offset, line.y)
+                for line in layout.lines
+                for x_offset, cursor_x in zip(line.x_offsets, line.word_x)]
+        metrics.inc("artists_created_total", len(dots), stage="dots", renderer="svg")
+        body.append(f'<g fill="{_color(font_color)}" stroke="{_color(font_color)}" '
+                    f'stroke-width="{_num(DOT_EDGE_WIDTH / PT_PER_MM)}">'
+                    + "".join(dots) + "</g>")
+
+    # Контуры букв
+    if show_font and not dots_only:
+        gost_line_width = (layout.cap_height_mm / 14.0) if line_width is None else line_width
+        symbols = _Symbols()
+        uses = text_uses(layout, symbols)
+        metrics.inc("artists_created_total", len(uses), stage="glyphs", renderer="svg")
+        defs.extend(symbols.defs)
+        body.append(f'<g fill="none" stroke="{_color(font_color)}" '
+                    f'stroke-width="{_num(gost_line_width / PT_PER_MM)}">'
+                    + "".join(uses) + "</g>")
+
+    return "\n".join([
+        '<?xml version="1.0" encoding="utf-8"?>',
+        f'<svg xmlns="{SVG_NS}" xmlns:xlink="{XLINK_NS}" version="1.1" '
+        f'width="{_num(w)}mm" height="{_num(h)}mm" viewBox="0 0 {_num(w)} {_num(h)}">',
+        "<defs>" + "\n".join(defs) + "</defs>",
+        f'<g transform="matrix(1 0 0 -1 0 {_num(h)})">',
+        "\n".join(body),
+        "</g>",
+        "</svg>",
+        "",
+    ])
+
+def render_svg(renderer, layout, **options):
+    """
+    Возвращает байты SVG страницы раскладки.
+    Цвета и толщина букв по умолчанию берутся из настроек TextRenderer.
+    """
+    return svg_document(layout, **_page_options(renderer, options)).encode("utf-8")
@@ -0,0 +1,151 @@
+# training_animation.py — анимация обучения из изображений букв letter_images/
+#  Кадры букв декодируются один раз на процесс, повторы не кодируются заново
+
+import io
+import os
+
+from PIL import Image
+
+from font_on_temp5_to_gost import LRUCache
+
+# ------------------ Константы ------------------
+IMAGE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "letter_images")
+CANVAS_SIZE = (300, 300)
+FRAME_DURATION = 0.5              # условная длительность, см. frame_ms()
+FRAME_DURATION_K = 5000           # множитель прежней версии: 0.5 → 2500 мс на букву
+FRAME_CACHE_SIZE = 512
+GIF_COLORS = 255                  # последний индекс палитры — прозрачный фон
+ALPHA_THRESHOLD = 128
+
+# Формат анимации → (формат Pillow, расширение файла)
+ANIMATION_FORMATS = {
+    "gif": ("GIF", ".gif"),
+    "webp": ("WEBP", ".webp"),
+    "apng": ("PNG", ".png"),
+}
+DEFAULT_ANIMATION_FORMAT = "gif"
+
+# Кадры букв общие для всех запросов процесса:
+# ключ — (путь, размер холста, режим), значение — готовый кадр или None
+FRAME_CACHE = LRUCache(FRAME_CACHE_SIZE)
+
+# ------------------ Кадры букв ------------------
+def letter_filename(ch):
+    suffix = ".upper" if ch.isupper() else ".lower"
+    return f"{ch}{suffix}.png"
+
+def frame_ms(frame_duration=FRAME_DURATION):
+    return int(frame_duration * FRAME_DURATION_K)
+
+def _quantize(img):
+    """
+    RGBA → палитра GIF: цвета букв + прозрачный индекс GIF_COLORS для фона.
+    """
+    alpha = img.getchannel("A")
+    frame = img.convert("RGB").quantize(GIF_COLORS, method=Image.Quantize.MEDIANCUT)
+    palette = frame.getpalette()[:GIF_COLORS * 3]
+    palette += [255, 255, 255] * (256 - len(palette) // 3)
+    frame.putpalette(palette)
+    frame.paste(GIF_COLORS, mask=alpha.point(lambda a: 255 if a < ALPHA_THRESHOLD else 0))
+    frame.info["transparency"] = GIF_COLORS
+    return frame
+
+def _load_frame(path, canvas_size, mode):
+    if not os.path.exists(path):
+        return None
+    with Image.open(path) as src:
+        img = src.convert("RGBA")
+    if img.size != canvas_size:
+        img = img.resize(canvas_size)
+    return _quantize(img) if mode == "P" else img
+
+def letter_frame(ch, image_dir=IMAGE_DIR, canvas_size=CANVAS_SIZE, mode="RGBA"):
+    """
+    Кадр буквы из кэша процесса; None — изображения для буквы нет.
+    mode="P" — кадр с палитрой для GIF, "RGBA" — для WebP и APNG.
+    """
+    path = os.path.join(image_dir, letter_filename(ch))
+    key = (os.path.abspath(path), tuple(canvas_size), mode)
+    return FRAME_CACHE.get(key, lambda: _load_frame(path, tuple(canvas_size), mode))
+
+def letter_sequence(text_lines, image_dir=IMAGE_DIR, canvas_size=CANVAS_SIZE, mode="RGBA",
+                    frame_duration=FRAME_DURATION):
+    """
+    Кадры анимации [(кадр, длительность мс), ...]. Подряд идущие одинаковые
+    буквы склеиваются в один кадр с суммарной длительностью, повторы
+    в разных местах текста ссылаются на один и тот же кадр из кэша.
+    """
+    duration = frame_ms(frame_duration)
+    sequence, missing = [], set()
+    for line in text_lines:
+        for ch in line:
+            if ch.isspace():
+                continue
+            frame = letter_frame(ch, image_dir, canvas_size, mode)
+            if frame is None:
+                if ch not in missing:
+                    missing.add(ch)
+                    print(f"⚠️ Нет изображения для буквы: {ch} → {letter_filename(ch)}")
+                continue
+            if sequence and sequence[-1][0] is frame:
+                sequence[-1][1] += duration
+            else:
+                sequence.append([frame, duration])
+    return [(frame, ms) for frame, ms in sequence]
+
+# ------------------ Запись анимации ------------------
+def _save_options(fmt, durations):
+    if fmt == "gif":
+        # disposal=2: буква стирается перед следующей, кадры не накладываются
+        return dict(duration=durations, loop=0, disposal=2, optimize=True)
+    if fmt == "webp":
+        return dict(duration=durations, loop=0, lossless=True, method=4)
+    return dict(duration=durations, loop=0, disposal=1, blend=0)
+
+def animation_bytes(text_lines, fmt=DEFAULT_ANIMATION_FORMAT, image_dir=IMAGE_DIR,
+                    canvas_size=CANVAS_SIZE, frame_duration=FRAME_DURATION):
+    """
+    Анимация обучения в байтах формата fmt ("gif", "webp", "apng");
+    None — ни для одной буквы текста нет изображения.
+    """
+    if fmt not in ANIMATION_FORMATS:
+        raise ValueError(f"Неизвестный формат анимации: {fmt}")
+    mode = "P" if fmt == "gif" else "RGBA"
+    sequence = letter_sequence(text_lines, image_dir, canvas_size, mode, frame_duration)
+    if not sequence:
+        return None
+
+    frames = [frame for frame, _ in sequence]
+    durations = [ms for _, ms in sequence]
+    pil_format = ANIMATION_FORMATS[fmt][0]
+    buf = io.BytesIO()
+    # Первый кадр копируется: save() пишет encoderinfo в сам объект, а кадры общие
+    first = frames[0].copy()
+    if len(frames) == 1:
+        first.save(buf, format=pil_format, **_save_options(fmt, durations[0]))
+    else:
+        first.save(buf, format=pil_format, save_all=True, append_images=frames[1:],
+                   **_save_options(fmt, durations))
+    return buf.getvalue()
+
+def animation_format(save_path):
+    """
+    Формат анимации по расширению файла; неизвестное расширение — GIF.
+    """
+    ext = os.path.splitext(save_path)[1].lower()
+    for fmt, (_, suffix) in ANIMATION_FORMATS.items():
+        if ext == suffix:
+            return fmt
+    return DEFAULT_ANIMATION_FORMAT
+
+def save_animation(text_lines, save_path, fmt=None, **kwargs):
+    """
+    Пишет анимацию в файл; формат по умолчанию — по расширению save_path.
+    Возвращает True, если файл записан.
+    """
+    data = animation_bytes(text_lines, fmt or animation_format(save_path), **kwargs)
+    if data is None:
+        return False
+    with open(save_path, "wb") as fh:
+        fh.write(data)
+    return True
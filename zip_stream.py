@@ -0,0 +1,53 @@
+# zip_stream.py — ZIP-архив, который отдаётся по частям по мере записи
+#  zipfile пишет в буфер без seek(), буфер сливается в ответ после каждого файла
+
+import io
+import zipfile
+
+# Уже сжатые форматы кладём без повторного сжатия
+STORED_SUFFIXES = (".pdf", ".png", ".gif", ".webp", ".zip")
+
+class _ZipSink(io.RawIOBase):
+    """
+    Поток только для записи: накапливает байты до следующего drain().
+    """
+
+    def __init__(self):
+        self._chunks = []
+
+    def writable(self):
+        return True
+
+    def write(self, data):
+        self._chunks.append(bytes(data))
+        return len(data)
+
+    def drain(self):
+        data = b"".join(self._chunks)
+        self._chunks.clear()
+        return data
+
+def _compression(name):
+    return zipfile.ZIP_STORED if name.lower().endswith(STORED_SUFFIXES) else zipfile.ZIP_DEFLATED
+
+def stream_zip(files):
+    """
+    Генератор байтов ZIP-архива. files — итерируемое пар (имя, содержимое),
+    где содержимое — байты или итерируемое частей байтов (например, поток PDF).
+    В памяти держится только текущий файл (или его текущая часть).
+    """
+    sink = _ZipSink()
+    with zipfile.ZipFile(sink, "w") as archive:
+        for name, content in files:
+            info = zipfile.ZipInfo(name)
+            info.compress_type = _compression(name)
+            info.external_attr = 0o644 << 16
+            with archive.open(info, "w", force_zip64=True) as entry:
+                if isinstance(content, (bytes, bytearray)):
+                    entry.write(content)
+                else:
+                    for part in content:
+                        entry.write(part)
+                        yield sink.drain()
+            yield sink.drain()
+    yield sink.drain()